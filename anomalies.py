@@ -0,0 +1,192 @@
+import logging
+import numpy as np
+from charts import format_time
+from history import in_order
+from thresholds import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Checks in the order they are reported
+KINDS = ('jump', 'rate', 'stuck')
+
+# Rows processed at a time, which bounds the memory of an update
+BLOCK_ROWS = 16384
+
+
+def ewm(inputs, weights, initial, block):
+    """Filter y[t] = (1 - w[t]) * y[t-1] + w[t] * x[t] down each column, starting from initial.
+
+    Rows are handled in blocks using cumulative products of the decay, which keeps
+    the recursion vectorized; the block length keeps the products from underflowing.
+    """
+    out = np.empty_like(inputs)
+    current = initial
+    for start in range(0, len(inputs), block):
+        end = min(start + block, len(inputs))
+        decay = np.cumprod(1 - weights[start:end], axis=0)
+        out[start:end] = decay * (current + np.cumsum(weights[start:end] * inputs[start:end] / decay, axis=0))
+        current = out[end - 1]
+    return out
+
+
+class AnomalyDetector:
+    """Streaming statistics for the metrics of one sensor.
+
+    Keeps an exponentially weighted mean and variance, the last reading and the
+    start of the current run of identical readings per metric, so memory does not
+    grow with the data. Rows are processed BLOCK_ROWS at a time with array
+    operations over all rows and metrics of a block.
+    """
+
+    def __init__(self, alpha, min_std, max_rate):
+        self.alpha = alpha
+        self.min_std = np.array([min_std[key] for key, _, _ in METRICS], dtype=float)
+        self.max_rate = np.array([max_rate[key] for key, _, _ in METRICS], dtype=float)
+        size = len(METRICS)
+        self.mean = np.full(size, np.nan)
+        self.var = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.last_value = np.full(size, np.nan)
+        self.last_time = np.zeros(size, dtype=np.int64)
+        self.run_start = np.zeros(size, dtype=np.int64)
+        self.last_timestamp = None
+        # Longest block for which (1 - alpha) ** block stays far above the float range
+        self.block = int(min(4096, max(1, 200 / -np.log10(1 - alpha))))
+
+    def update(self, columns, settings=(), warmup=0):
+        """Advance the statistics over new readings.
+
+        settings holds the (zscore, stuck_minutes) pairs in use. For each of them the
+        readings that fail a check are summarized as in find_anomalies; without any,
+        only the statistics are advanced and no per-row checks are built. Late rows
+        are skipped, as in the history store. Returns {settings: found}.
+        """
+        found = {key: {} for key in settings}
+        times = columns['time']
+        keep = in_order(times, self.last_timestamp)
+        if not keep.all():
+            columns = {name: values[keep] for name, values in columns.items()}
+        times = columns['time']
+        for start in range(0, len(times), BLOCK_ROWS):
+            end = start + BLOCK_ROWS
+            values = np.column_stack([columns[key][start:end] for key, _, _ in METRICS]).astype(float)
+            checks = self._advance(times[start:end], values, bool(settings))
+            for key in settings:
+                add_found(found[key], find_anomalies(checks, *key, warmup))
+        return found
+
+    def _advance(self, times, values, with_checks):
+        """Advance the statistics over one block, returning its per-row checks if asked for.
+
+        Each check compares a reading with the state before it: the z-score against
+        the weighted mean and deviation, the change per minute since the previous
+        reading and the seconds the value has not changed.
+        """
+        rows, metrics = values.shape
+        valid = ~np.isnan(values)
+        indices = np.arange(metrics)
+
+        # Metrics seen for the first time start from their first reading
+        new = (self.count == 0) & valid.any(axis=0)
+        self.mean[new] = values[valid.argmax(axis=0)[new], indices[new]]
+
+        # Previous reading of every row and metric, carried over from the last block
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(rows)[:, None], -1), axis=0)
+        previous = np.vstack([np.full((1, metrics), -1), last_valid[:-1]])
+        previous_values = np.where(previous >= 0, values[np.maximum(previous, 0), indices], self.last_value)
+
+        # Missing readings get no weight, so they leave the statistics unchanged
+        weights = np.where(valid, self.alpha, 0.0)
+        means = ewm(np.where(valid, values, 0.0), weights, self.mean, self.block)
+        mean_before = np.vstack([self.mean, means[:-1]])
+        deviation = np.where(valid, values - mean_before, 0.0)
+        variances = ewm((1 - self.alpha) * deviation ** 2, weights, self.var, self.block)
+
+        # A run of identical readings starts at every reading that differs from the one before
+        changed = valid & ~(values == previous_values)
+        run_start = np.maximum(
+            np.maximum.accumulate(np.where(changed, times[:, None], np.iinfo(np.int64).min), axis=0),
+            self.run_start
+        )
+
+        checks = None
+        if with_checks:
+            var_before = np.vstack([self.var, variances[:-1]])
+            previous_times = np.where(previous >= 0, times[np.maximum(previous, 0)], self.last_time)
+            rate = np.abs(values - previous_values) / (np.maximum(times[:, None] - previous_times, 1) / 60)
+            checks = {
+                'time': times,
+                'values': values,
+                'valid': valid,
+                'count': self.count + np.cumsum(valid, axis=0) - valid,
+                'mean': mean_before,
+                'zscore': np.abs(deviation) / np.maximum(np.sqrt(var_before), self.min_std),
+                'rate': rate,
+                'fast': rate > self.max_rate,
+                'stuck_for': np.where(valid, times[:, None] - run_start, 0),
+            }
+
+        self.mean = means[-1]
+        self.var = variances[-1]
+        self.count = self.count + valid.sum(axis=0)
+        seen = last_valid[-1] >= 0
+        self.last_value = np.where(seen, values[np.maximum(last_valid[-1], 0), indices], self.last_value)
+        self.last_time = np.where(seen, times[np.maximum(last_valid[-1], 0)], self.last_time)
+        self.run_start = run_start[-1]
+        self.last_timestamp = int(times[-1])
+        return checks
+
+
+def find_anomalies(checks, zscore, stuck_minutes, warmup):
+    """Summaries of the readings that fail a check, as {metric: {kind: summary}}."""
+    valid = checks['valid']
+    masks = {
+        'jump': valid & (checks['count'] >= warmup) & (checks['zscore'] > zscore),
+        'rate': valid & checks['fast'],
+        'stuck': valid & (checks['stuck_for'] >= stuck_minutes * 60),
+    }
+    found = {}
+    for kind in KINDS:
+        mask = masks[kind]
+        counts = mask.sum(axis=0)
+        if not counts.any():
+            continue
+        last_rows = len(mask) - 1 - mask[::-1].argmax(axis=0)
+        for index, (key, _, _) in enumerate(METRICS):
+            if not counts[index]:
+                continue
+            row = last_rows[index]
+            found.setdefault(key, {})[kind] = {
+                'count': int(counts[index]),
+                'time': int(checks['time'][row]),
+                'value': float(checks['values'][row, index]),
+                'mean': float(checks['mean'][row, index]),
+                'rate': float(checks['rate'][row, index]),
+                'since': int(checks['time'][row] - checks['stuck_for'][row, index]),
+            }
+    return found
+
+
+def add_found(total, found):
+    """Merge the anomalies of a later block into earlier ones, keeping the latest reading."""
+    for key, kinds in found.items():
+        for kind, summary in kinds.items():
+            earlier = total.setdefault(key, {}).get(kind)
+            if earlier is not None:
+                summary = dict(summary, count=earlier['count'] + summary['count'])
+            total[key][kind] = summary
+
+
+def format_anomaly(label, kind, summary):
+    count = summary['count']
+    readings = f"{count} reading{'s' if count != 1 else ''}"
+    if kind == 'jump':
+        return (
+            f"📈 {label} jumped to {summary['value']:g} at {format_time(summary['time'])}, "
+            f"away from its recent mean of {summary['mean']:.4g} ({readings})"
+        )
+    if kind == 'rate':
+        return (
+            f"⚡ {label} changed by {summary['rate']:.4g} per minute at {format_time(summary['time'])} ({readings})"
+        )
+    return f"🧊 {label} stuck at {summary['value']:g} since {format_time(summary['since'])}"
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import itertools
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from datetime import datetime
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'pseudo data generator'))
+import config
+from fake_bot import FakeBot
+from dispatch import AlertDispatcher
+from file_events import FileEventBridge
+from sensor_data_simulator import HEADER, PeriodGenerator
+from bench_threshold_index import random_thresholds
+
+'''
+End-to-end benchmark of the ingest-to-alert path: generated CSV data is fed through
+the file event bridge into CSVHandler, and alerts go out through the dispatcher to a
+FakeBot, without network access. Every combination of file size, users and threshold
+diversity runs in its own process so peak RSS is measured per scenario.
+
+For each scenario a backlog file is ingested (rows per second), then single rows with
+out-of-range readings are appended and the time from the append to each alert being
+sent is measured (p50/p95/p99).
+
+Example usage:
+python benchmarks/bench_ingest.py --rows 10000 100000 --users 10 1000 --diversity 1 100 --output results.json
+python benchmarks/bench_ingest.py --baseline benchmarks/baseline_ingest.json
+'''
+
+# Typical readings with a short hot spell every thousand rows
+PERIODS = [
+    {'time': 950, 'temperature': [20, 25], 'humidity': [0.5, 0.7], 'light': [1800, 2200], 'error': 0.01},
+    {'time': 50, 'temperature': [28, 35], 'humidity': [0.5, 0.7], 'light': [1800, 2200], 'error': 0},
+]
+HOT_PERIODS = PERIODS[1:]
+
+# (result field, True if higher is better) checked against the baseline
+COMPARED = [
+    ('rows_per_second', True),
+    ('latency_p95_ms', False),
+    ('peak_rss_mb', False),
+]
+
+
+def write_rows(path, generator, count, header):
+    with open(path, 'a', newline='') as f:
+        if header:
+            f.write(','.join(HEADER) + '\n')
+        generator.next_frame(count).to_csv(f, header=False, index=False)
+
+
+async def drain(dispatcher):
+    while dispatcher.pending_count:
+        await asyncio.sleep(0.001)
+
+
+async def run_scenario(rows, users, diversity, args):
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    config.DATA_DIR = workdir
+    config.HISTORY_DIR = os.path.join(workdir, 'history')
+    import bot
+    logging.getLogger().setLevel(args.log_level)
+
+    rng = np.random.default_rng(args.seed)
+    threshold_sets = random_thresholds(rng, diversity)
+    for user_id in range(users):
+        bot.user_states[user_id] = {'authenticated': True}
+        bot.user_thresholds[user_id] = threshold_sets[user_id % diversity]
+        bot.user_alert_frequencies[user_id] = 0
+    bot.sessions.load()
+    bot.threshold_index.rebuild(bot.user_thresholds)
+
+    fake_bot = FakeBot(latency=args.latency)
+    dispatcher = AlertDispatcher(fake_bot, workers=args.senders, max_pending=args.outbox,
+                                 global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_rate)
+    dispatcher.start()
+    executor = None
+    if args.parse_workers:
+        executor = ProcessPoolExecutor(args.parse_workers, mp_context=multiprocessing.get_context('spawn'))
+    bridge = FileEventBridge(window=args.window)
+    bridge.bind(asyncio.get_running_loop())
+    handler = bot.CSVHandler(None, bridge=bridge, dispatcher=dispatcher, executor=executor)
+
+    processed = asyncio.Event()
+
+    async def process(path):
+        await handler.process_file(path)
+        processed.set()
+
+    consumer = asyncio.create_task(bridge.run(process))
+    path = os.path.join(workdir, 'bench.csv')
+    start_time = datetime(2025, 1, 1)
+    backlog = PeriodGenerator(PERIODS, np.random.default_rng(args.seed), start_time, repeat=True)
+    hot = PeriodGenerator(HOT_PERIODS, np.random.default_rng(args.seed + 1),
+                          datetime.fromtimestamp(start_time.timestamp() + rows * 60), repeat=True)
+
+    try:
+        # Backlog: one file event for a file of the given size
+        write_rows(path, backlog, rows, header=True)
+        file_bytes = os.path.getsize(path)
+        processed.clear()
+        started = time.perf_counter()
+        bridge.submit(path)
+        await processed.wait()
+        ingest_seconds = time.perf_counter() - started
+        await drain(dispatcher)
+        backlog_seconds = time.perf_counter() - started
+        backlog_alerts = len(fake_bot.sent)
+
+        # Live appends: time from the row landing in the file to each alert being sent
+        latencies = []
+        for _ in range(args.appends):
+            sent_before = len(fake_bot.sent)
+            processed.clear()
+            appended = time.monotonic()
+            write_rows(path, hot, args.append_rows, header=False)
+            bridge.submit(path)
+            await processed.wait()
+            await drain(dispatcher)
+            latencies.extend(sent_at - appended for sent_at, _, _ in fake_bot.sent[sent_before:])
+            await asyncio.sleep(args.append_interval)
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await dispatcher.stop()
+        if executor is not None:
+            executor.shutdown()
+        for store in bot.history_stores.values():
+            store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        'rows': rows,
+        'users': users,
+        'diversity': diversity,
+        'file_bytes': file_bytes,
+        'ingest_seconds': round(ingest_seconds, 4),
+        'backlog_seconds': round(backlog_seconds, 4),
+        'rows_per_second': round(rows / ingest_seconds, 1),
+        'backlog_alerts': backlog_alerts,
+        'live_alerts': len(latencies),
+        'latency_p50_ms': None,
+        'latency_p95_ms': None,
+        'latency_p99_ms': None,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'peak_rss_workers_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'dispatcher': dispatcher.stats(),
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        result.update(latency_p50_ms=round(p50, 2), latency_p95_ms=round(p95, 2), latency_p99_ms=round(p99, 2))
+    return result
+
+
+def scenario_key(result):
+    return result['rows'], result['users'], result['diversity']
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of every metric that is worse than the baseline by more than tolerance."""
+    previous = {scenario_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(scenario_key(result))
+        if old is None:
+            continue
+        for field, higher_is_better in COMPARED:
+            if result.get(field) is None or not old.get(field):
+                continue
+            change = result[field] / old[field] - 1
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"rows={result['rows']} users={result['users']} diversity={result['diversity']}: "
+                                   f"{field} {old[field]} -> {result[field]} ({change:+.0%})")
+    return regressions
+
+
+def run_sweep(args, passthrough):
+    results = []
+    scenarios = sorted({(rows, users, min(diversity, users))
+                        for rows, users, diversity in itertools.product(args.rows, args.users, args.diversity)})
+    for rows, users, diversity in scenarios:
+        scenario = json.dumps({'rows': rows, 'users': users, 'diversity': diversity})
+        completed = subprocess.run([sys.executable, __file__, '--scenario', scenario] + passthrough,
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            sys.stderr.write(completed.stderr)
+            raise SystemExit(f"Scenario {scenario} failed")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"rows={rows:>8} users={users:>6} diversity={diversity:>5}  "
+              f"{result['rows_per_second']:>10.0f} rows/s  "
+              f"p50 {result['latency_p50_ms']} ms  p95 {result['latency_p95_ms']} ms  p99 {result['latency_p99_ms']} ms  "
+              f"peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ingest-to-alert path end to end.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Backlog file sizes in rows')
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 1000], help='Numbers of subscribed users')
+    parser.add_argument('--diversity', type=int, nargs='+', default=[1, 100], help='Numbers of distinct threshold sets')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare against results stored in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression against the baseline')
+    parser.add_argument('--scenario', type=str, default=None, help=argparse.SUPPRESS)
+    scenario_args = parser.add_argument_group('scenario settings')
+    scenario_args.add_argument('--appends', type=int, default=20, help='Number of live appends per scenario')
+    scenario_args.add_argument('--append-rows', type=int, default=1, help='Rows per live append')
+    scenario_args.add_argument('--append-interval', type=float, default=0.05, help='Seconds between live appends')
+    scenario_args.add_argument('--window', type=float, default=0.0, help='File event coalescing window in seconds')
+    scenario_args.add_argument('--parse-workers', type=int, default=config.PARSE_WORKERS, help='Parse processes, 0 to parse inline')
+    scenario_args.add_argument('--senders', type=int, default=config.ALERT_SENDER_TASKS, help='Alert sender tasks')
+    scenario_args.add_argument('--outbox', type=int, default=1_000_000, help='Maximum queued alerts')
+    scenario_args.add_argument('--latency', type=float, default=0.0, help='Simulated Telegram request latency in seconds')
+    scenario_args.add_argument('--global-rate', type=float, default=1e9, help='Global messages per second (default: unlimited)')
+    scenario_args.add_argument('--chat-rate', type=float, default=1e9, help='Messages per second per chat (default: unlimited)')
+    scenario_args.add_argument('--log-level', type=str, default='WARNING', help='Log level while running scenarios')
+    scenario_args.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    if args.scenario:
+        scenario = json.loads(args.scenario)
+        result = asyncio.run(run_scenario(scenario['rows'], scenario['users'], scenario['diversity'], args))
+        print(json.dumps(result))
+        return
+
+    # Scenario settings are passed on unchanged to every scenario process
+    passthrough = []
+    for action in scenario_args._group_actions:
+        passthrough += [action.option_strings[0], str(getattr(args, action.dest))]
+    report = {
+        'settings': {action.dest: getattr(args, action.dest) for action in scenario_args._group_actions},
+        'python': sys.version.split()[0],
+        'cpus': os.cpu_count(),
+        'results': run_sweep(args, passthrough),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get('settings') != report['settings']:
+            print("Warning: baseline was recorded with different scenario settings", file=sys.stderr)
+        regressions = compare(report['results'], baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
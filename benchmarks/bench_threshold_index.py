@@ -0,0 +1,91 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from thresholds import METRICS, ThresholdEngine, ThresholdIndex
+
+'''
+Compares violator lookup through ThresholdIndex with the per-user mask
+approach and the grouped NumPy broadcast for different numbers of users.
+Example usage:
+python benchmarks/bench_threshold_index.py --users 10 1000 100000 --rows 60
+'''
+
+
+def random_thresholds(rng, count):
+    # Ranges scattered around the simulator's typical readings
+    centers = {'temperature': 22.5, 'humidity': 0.6, 'light': 2000}
+    spreads = {'temperature': 10, 'humidity': 0.4, 'light': 1500}
+    result = {}
+    for user_id in range(count):
+        thresholds = {}
+        for key, _, _ in METRICS:
+            low = centers[key] - spreads[key] * rng.uniform(0.3, 1.0)
+            high = centers[key] + spreads[key] * rng.uniform(0.3, 1.0)
+            thresholds[key] = {'min': round(low, 2), 'max': round(high, 2)}
+        result[user_id] = thresholds
+    return result
+
+
+def random_rows(rng, count):
+    # Mostly in-range readings with a few spikes
+    df = pd.DataFrame({
+        'Temperature': rng.uniform(20, 25, count).round(2),
+        'Humidity': rng.uniform(0.5, 0.7, count).round(2),
+        'Light': rng.uniform(1800, 2200, count).round(2),
+    })
+    spikes = rng.random(count) < 0.05
+    df.loc[spikes, 'Temperature'] = rng.uniform(28, 35, spikes.sum()).round(2)
+    return df
+
+
+def per_user_masks(df, thresholds_by_user):
+    results = set()
+    for user_id, thresholds in thresholds_by_user.items():
+        for key, column, _ in METRICS:
+            out_of_range = (df[column] < thresholds[key]['min']) | (df[column] > thresholds[key]['max'])
+            if out_of_range.any():
+                results.add(user_id)
+    return results
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark threshold index lookups against per-user masks.')
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 1000, 100000], help='Numbers of users to test')
+    parser.add_argument('--rows', type=int, default=60, help='Number of new rows per evaluation')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement (best is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    df = random_rows(rng, args.rows)
+    print(f"{'users':>8} {'masks (s)':>12} {'broadcast (s)':>14} {'index (s)':>12} {'build (s)':>12} {'violators':>10}")
+    for count in args.users:
+        thresholds_by_user = random_thresholds(rng, count)
+
+        start = time.perf_counter()
+        index = ThresholdIndex(thresholds_by_user)
+        build = time.perf_counter() - start
+
+        masks_time, expected = timed(lambda: per_user_masks(df, thresholds_by_user), 1 if count > 10000 else args.repeat)
+        broadcast_time, broadcast = timed(lambda: ThresholdEngine().evaluate(df, thresholds_by_user), args.repeat)
+        index_time, indexed = timed(lambda: index.evaluate(df), args.repeat)
+        assert indexed == expected == broadcast, 'Evaluation strategies disagree'
+        print(f"{count:>8} {masks_time:>12.4f} {broadcast_time:>14.4f} {index_time:>12.4f} {build:>12.4f} {len(indexed):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import itertools
+from pathlib import Path
+import numpy as np
+import httpx
+import tornado.web
+
+ROOT = Path(__file__).resolve().parent.parent
+
+'''
+Measures command round-trip latency and throughput of the bot in webhook mode without
+reaching Telegram. bot.py runs as a subprocess with its Bot API URL pointed at a local
+fake API server; concurrent simulated users POST synthetic Updates to its webhook and
+the time until the fake API receives each reply is recorded.
+Example usage:
+python benchmarks/bench_webhook.py --users 50 --commands 20
+'''
+
+COMMANDS = ['/help', '/current', '/sensors', '/stats']
+
+
+class FakeTelegramAPI:
+    """Answers the Bot API methods the bot uses and resolves a waiter per chat on every reply."""
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.waiters = {}
+        self.replies = 0
+        self.message_ids = itertools.count(1)
+
+    def handle(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method == 'setWebhook':
+            self.ready.set()
+            return True
+        if method in ('sendMessage', 'sendPhoto'):
+            chat_id = int(params['chat_id'])
+            self.replies += 1
+            waiter = self.waiters.pop(chat_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+            return {'message_id': next(self.message_ids), 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        return True
+
+
+class FakeTelegramHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    def post(self, token, method):
+        params = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        self.write({'ok': True, 'result': self.api.handle(method, params)})
+
+    get = post
+
+
+def make_update(update_id, user_id, text):
+    command = text.split()[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench{user_id}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        },
+    }
+
+
+async def simulate_user(client, api, args, url, user_id, update_ids, latencies, acks):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    texts = ['/start'] + [COMMANDS[i % len(COMMANDS)] for i in range(args.commands)]
+    for text in texts:
+        waiter = asyncio.get_running_loop().create_future()
+        api.waiters[user_id] = waiter
+        started = time.perf_counter()
+        response = await client.post(url, json=make_update(next(update_ids), user_id, text), headers=headers)
+        acks.append(time.perf_counter() - started)
+        response.raise_for_status()
+        latencies.append(await asyncio.wait_for(waiter, args.timeout) - started)
+
+
+async def run(args):
+    api = FakeTelegramAPI()
+    app = tornado.web.Application([(r'/bot([^/]+)/(\w+)', FakeTelegramHandler, {'api': api})])
+    server = app.listen(args.api_port, '127.0.0.1')
+
+    user_ids = range(1, args.users + 1)
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:BENCHMARK',
+        TELEGRAM_API_URL=f'http://127.0.0.1:{args.api_port}',
+        WEBHOOK_URL=f'http://127.0.0.1:{args.port}',
+        WEBHOOK_LISTEN='127.0.0.1',
+        WEBHOOK_PORT=str(args.port),
+        WEBHOOK_SECRET=args.secret,
+        WHITELISTED_USERS=','.join(f'bench{user_id}' for user_id in user_ids),
+        METRICS_PORT='0',
+    )
+    workdir = tempfile.mkdtemp(prefix='bench_webhook_')
+    log_path = Path(workdir) / 'bot.log'
+    with open(log_path, 'w') as log:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(ROOT / 'bot.py'), cwd=workdir, env=env, stdout=log, stderr=log
+        )
+    try:
+        await asyncio.wait_for(api.ready.wait(), args.timeout)
+        url = f'http://127.0.0.1:{args.port}/telegram'
+        latencies = []
+        acks = []
+        update_ids = itertools.count(1)
+        limits = httpx.Limits(max_connections=args.users)
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                simulate_user(client, api, args, url, user_id, update_ids, latencies, acks) for user_id in user_ids
+            ))
+            elapsed = time.perf_counter() - started
+    except (asyncio.TimeoutError, httpx.HTTPError) as e:
+        print(f"Benchmark failed: {e!r}, see {log_path}", file=sys.stderr)
+        raise SystemExit(1)
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 15)
+            except asyncio.TimeoutError:
+                process.kill()
+        server.stop()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'settings': {'users': args.users, 'commands': args.commands},
+        'commands': len(latencies),
+        'seconds': round(elapsed, 3),
+        'commands_per_second': round(len(latencies) / elapsed, 1),
+        'latency_p50_ms': round(p50, 2),
+        'latency_p95_ms': round(p95, 2),
+        'latency_p99_ms': round(p99, 2),
+        'ack_p50_ms': round(float(np.percentile(acks, 50)) * 1000, 2),
+        'replies': api.replies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark command round trips in webhook mode.')
+    parser.add_argument('--users', type=int, default=20, help='Number of concurrent users')
+    parser.add_argument('--commands', type=int, default=10, help='Commands per user after /start')
+    parser.add_argument('--port', type=int, default=18443, help='Port of the bot webhook')
+    parser.add_argument('--api-port', type=int, default=18081, help='Port of the fake Bot API server')
+    parser.add_argument('--secret', type=str, default='benchmark-secret', help='Webhook secret token')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for the bot')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file (default: stdout)')
+    args = parser.parse_args()
+
+    output = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
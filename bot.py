@@ -1,14 +1,33 @@
 import os
+import asyncio
 import logging
+import multiprocessing
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
-import pandas as pd
+import numpy as np
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 import config
+import metrics
+from csv_tail import CSVTailReader, line_boundary
+from file_events import FileEventBridge
+from dispatch import AlertDispatcher
+from state_store import SQLiteStateBackend, StateStore
+from sessions import SessionManager
+from error_rate import ErrorRateMonitor
+from history import MISSING_TIME, HistoryStore, frame_to_columns, parse_times
+from recent_window import RecentWindow
+from charts import METRIC_NAMES, ChartCache, format_history, parse_duration, render_chart
+from thresholds import METRICS, ThresholdEngine, ThresholdIndex
+from episodes import EpisodeTracker, check_window, format_episode, format_window_check
+from anomalies import AnomalyDetector, format_anomaly
+from sensors import find_csv_files, is_subscribed, resolve_thresholds, sensor_id
+from retention import (compress_segment, delete_expired, find_segments, is_data_file, is_segment, rotate_file,
+                       segment_path, source_path)
 
 # Set up logging
 logging.basicConfig(
@@ -19,159 +38,530 @@ logging.basicConfig(
 logging.getLogger('httpx').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-# User states
-user_states = {}
-user_thresholds = {}
-user_alert_frequencies = {}
-login_attempts = {}
+# User states, kept in memory and persisted in the background by the state store
+state_store = StateStore(flush_interval=config.STATE_FLUSH_INTERVAL)
+user_states = state_store.table('user_states')
+user_thresholds = state_store.table('user_thresholds')
+user_alert_frequencies = state_store.table('user_alert_frequencies')
+login_attempts = state_store.table('login_attempts')
+login_lockouts = state_store.table('login_lockouts')
+user_error_rates = state_store.table('user_error_rates')
+user_subscriptions = state_store.table('user_subscriptions')
+user_sensor_thresholds = state_store.table('user_sensor_thresholds')
+user_anomaly_settings = state_store.table('user_anomaly_settings')
+file_checkpoints = state_store.table('file_checkpoints')
+file_rotations = state_store.table('file_rotations')
+sessions = SessionManager(user_states, config.LOGIN_EXPIRATION, config.SESSION_EXPIRY_WARNING)
+threshold_index = ThresholdIndex()
+history_stores = {}
+recent_windows = {}
+chart_cache = ChartCache(size=config.CHART_CACHE_SIZE)
+
+def get_history_store(sensor):
+    if sensor not in history_stores:
+        history_stores[sensor] = HistoryStore(Path(config.HISTORY_DIR) / sensor)
+    return history_stores[sensor]
+
+def get_recent_window(sensor):
+    if sensor not in recent_windows:
+        window = RecentWindow(config.RECENT_WINDOW_ROWS)
+        # Start from the stored history so trends are available right after a restart
+        window.append(get_history_store(sensor).latest(config.RECENT_WINDOW_ROWS))
+        recent_windows[sensor] = window
+    return recent_windows[sensor]
+
+def get_readings(name, column, duration):
+    window = recent_windows[name]
+    end = window.last_timestamp
+    start = end - duration
+    if window.first_timestamp <= start or name not in history_stores:
+        readings = window.query(start, end)
+    else:
+        readings = history_stores[name].query(start, end)
+    return {'time': readings['time'], 'values': readings[column]}
+
+def check_new_range(user_id, sensor, thresholds):
+    """Evaluate a user's new range against the recent readings held in memory."""
+    in_range = []
+    out_of_range = []
+    for name in [sensor] if sensor else sorted(recent_windows):
+        window = recent_windows.get(name)
+        if window is None or not len(window):
+            continue
+        if not sensor and not is_subscribed(user_id, name, user_subscriptions):
+            continue
+        # Sensors with their own range for this user are not affected by a new default range
+        if resolve_thresholds(user_id, name, user_sensor_thresholds, user_thresholds, config.DEFAULT_THRESHOLDS) is not thresholds:
+            continue
+        end = window.last_timestamp
+        readings = window.query(end - config.RANGE_CHECK_WINDOW * 60, end)
+        summaries = check_window(readings, thresholds)
+        if not summaries:
+            in_range.append(name)
+            continue
+        lines = [f"📍 Sensor {name}:"]
+        for key, _, label in METRICS:
+            if key in summaries:
+                lines.append(format_window_check(
+                    label, summaries[key], len(readings['time']), thresholds[key]['min'], thresholds[key]['max']
+                ))
+        out_of_range.append("\n".join(lines))
+
+    if not in_range and not out_of_range:
+        return None
+    parts = [f"With the new range, over the last {config.RANGE_CHECK_WINDOW} minutes of readings:"]
+    parts.extend(out_of_range[:config.RANGE_CHECK_MAX_SENSORS])
+    if len(out_of_range) > config.RANGE_CHECK_MAX_SENSORS:
+        parts.append(f"...and {len(out_of_range) - config.RANGE_CHECK_MAX_SENSORS} more sensors with readings out of range")
+    if in_range:
+        parts.append(f"✅ All readings in range on {len(in_range)} sensor{'s' if len(in_range) != 1 else ''}")
+    return "\n\n".join(parts)
+
+def lockout_remaining(user_id):
+    """Minutes left of a user's login lockout, resetting their attempts once it is over."""
+    if login_attempts.get(user_id, 0) < config.MAX_LOGIN_ATTEMPTS:
+        return 0
+    now = datetime.now()
+    # Lockouts stored before they had a start time begin now
+    locked_at = login_lockouts.setdefault(user_id, now)
+    remaining = config.LOGIN_LOCKOUT - (now - locked_at).total_seconds() / 60
+    if remaining > 0:
+        return max(1, round(remaining))
+    login_attempts[user_id] = 0
+    login_lockouts.pop(user_id, None)
+    return 0
+
+def drop_processed(df, times, last_timestamp, replaying):
+    """Advance the last processed timestamp over new rows with the given epoch seconds.
+
+    While a file is read again from the start, rows at or before the last processed
+    timestamp were handled before and are dropped. Appended rows are always kept,
+    even when their clock went back.
+    """
+    valid = times != MISSING_TIME
+    if replaying and last_timestamp is not None:
+        keep = ~valid | (times > last_timestamp)
+        if not keep.all():
+            logger.info(f"Skipping {len(df) - keep.sum()} rows that were already processed")
+            df, valid, times = df[keep], valid[keep], times[keep]
+    if valid.any():
+        newest = int(times[valid].max())
+        last_timestamp = newest if last_timestamp is None else max(last_timestamp, newest)
+    return df, times, last_timestamp
 
 class CSVHandler(FileSystemEventHandler):
-    def __init__(self, app):
+    def __init__(self, app, bridge=None, dispatcher=None, executor=None):
         self.app = app
+        self.bridge = bridge
+        self.dispatcher = dispatcher
+        self.executor = executor
         self.last_processed = None
+        self.readers = {}
+        # Files read again from the start, with the line boundary up to which rows may have been processed
+        self.replays = {}
+        self.sensors = {}
+        self.error_monitors = {}
+        self.anomaly_detectors = {}
+        # Rotated segments still being read, with their last seen size, when it changed and
+        # when a writer still appending to it was last reported
+        self.segments = {}
+        # Reading, rotating and finishing files never interleave
+        self.lock = asyncio.Lock()
+        self.engine = ThresholdEngine(threshold_index, config.THRESHOLD_INDEX_MIN_USERS)
+        self.episodes = EpisodeTracker(config.ALERT_HYSTERESIS)
         logger.info("CSVHandler initialized")
 
-    async def on_created(self, event):
-        if event.is_directory or not event.src_path.endswith('.csv'):
+    # Watchdog calls these from the observer thread; hand the path to the event loop
+    def on_created(self, event):
+        if event.is_directory or not is_data_file(event.src_path):
             return
         logger.info(f"New CSV file detected: {event.src_path}")
-        await self.process_file(event.src_path)
+        self.bridge.submit(event.src_path)
+
+    def on_modified(self, event):
+        if event.is_directory or not is_data_file(event.src_path):
+            return
+        logger.debug(f"CSV file modified: {event.src_path}")
+        self.bridge.submit(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory or not is_data_file(event.dest_path):
+            return
+        logger.info(f"CSV file moved into place: {event.dest_path}")
+        self.bridge.submit(event.dest_path)
+
+    def get_reader(self, file_path):
+        file_path = str(file_path)
+        if file_path not in self.readers:
+            reader = CSVTailReader(file_path)
+            checkpoint = file_checkpoints.get(file_path)
+            if checkpoint and reader.restore(checkpoint):
+                logger.info(f"Resuming {file_path} from its checkpoint at byte {reader.offset}")
+                if checkpoint.get('replay_end') is not None:
+                    # Older checkpoints may end the re-read inside a line, which would never be read
+                    self.replays[file_path] = line_boundary(file_path, checkpoint['replay_end'])
+            elif checkpoint and checkpoint.get('last_timestamp') is not None:
+                # The file changed while the bot was down, rows it already held were processed
+                try:
+                    self.replays[file_path] = line_boundary(file_path, os.path.getsize(file_path))
+                except FileNotFoundError:
+                    pass
+            self.readers[file_path] = reader
+        return self.readers[file_path]
+
+    def get_sensor(self, file_path):
+        file_path = str(file_path)
+        if file_path not in self.sensors:
+            # Rotated segments belong to the sensor of the file they came from
+            self.sensors[file_path] = sensor_id(source_path(file_path), config.DATA_DIR)
+        return self.sensors[file_path]
 
-    async def on_modified(self, event):
-        if event.is_directory or not event.src_path.endswith('.csv'):
+    def get_error_monitor(self, sensor):
+        if sensor not in self.error_monitors:
+            self.error_monitors[sensor] = ErrorRateMonitor(
+                window=config.ERROR_RATE_WINDOW * 60,
+                bucket=config.ERROR_RATE_BUCKET
+            )
+        return self.error_monitors[sensor]
+
+    def load_sensor(self, file_path):
+        """Load a sensor's stored readings so queries and /stats work before it writes again."""
+        sensor = self.get_sensor(file_path)
+        window = get_recent_window(sensor)
+        if not len(window) or sensor in self.error_monitors:
             return
-        logger.info(f"CSV file modified: {event.src_path}")
-        await self.process_file(event.src_path)
+        end = window.last_timestamp
+        readings = window.query(end - config.ERROR_RATE_WINDOW * 60, end)
+        missing = np.zeros(len(readings['time']), dtype=bool)
+        for key, _, _ in METRICS:
+            missing |= np.isnan(readings[key])
+        self.get_error_monitor(sensor).add(readings['time'], missing)
+
+    def get_anomaly_detector(self, sensor):
+        if sensor not in self.anomaly_detectors:
+            detector = AnomalyDetector(config.ANOMALY_ALPHA, config.ANOMALY_MIN_STD, config.ANOMALY_MAX_RATE)
+            # Warm up on the readings in memory so a restart does not reset the statistics
+            window = get_recent_window(sensor)
+            if len(window):
+                detector.update(window.ordered())
+            self.anomaly_detectors[sensor] = detector
+        return self.anomaly_detectors[sensor]
 
     async def process_file(self, file_path):
+        async with self.lock:
+            if is_segment(file_path) and file_path not in self.segments:
+                # An event for a segment that has been finished already
+                return
+            await self.read_file(file_path)
+
+    async def read_file(self, file_path):
         try:
-            logger.info(f"Starting to process file: {file_path}")
-            df = pd.read_csv(file_path)
-            logger.info(f"Successfully read CSV file with {len(df)} rows")
-            logger.info(f"DataFrame columns: {df.columns.tolist()}")
-            logger.info(f"Sample data:\n{df.head()}")
-            
+            logger.debug(f"Starting to process file: {file_path}")
+            sensor = self.get_sensor(file_path)
+            reader = self.get_reader(file_path)
+            last_timestamp = file_checkpoints.get(file_path, {}).get('last_timestamp')
+            checkpointed = False
+            # Large backlogs are read in bounded batches, parsed in the process pool
+            while True:
+                started = time.perf_counter()
+                start = reader.offset
+                resets = reader.resets
+                max_bytes = config.MAX_READ_BYTES
+                replay_end = self.replays.get(file_path)
+                if replay_end is not None and start < replay_end:
+                    # End the batch where the re-read ends, rows after it are new
+                    max_bytes = min(max_bytes, replay_end - start)
+                df = await reader.read_chunk(
+                    self.executor,
+                    pool_threshold=config.PARSE_IN_POOL_BYTES,
+                    max_bytes=max_bytes
+                )
+                if reader.resets != resets:
+                    # Replaced or rewritten: the rows it holds now may have been processed already
+                    start = 0
+                    replay_end = self.replays[file_path] = line_boundary(file_path, reader.size)
+                if df is None:
+                    break
+                metrics.PARSE_SECONDS.observe(time.perf_counter() - started)
+                metrics.ROWS_PARSED.inc(len(df))
+                if not df.empty:
+                    # Only a re-read skips rows up to the last processed timestamp
+                    replaying = replay_end is not None and start < replay_end
+                    # The time column is parsed once and passed along with the rows
+                    times = parse_times(df['Time'])
+                    df, times, last_timestamp = drop_processed(df, times, last_timestamp, replaying)
+                if not df.empty:
+                    await self.process_rows(sensor, df, times)
+                if replay_end is not None and reader.offset >= replay_end:
+                    del self.replays[file_path]
+                file_checkpoints[file_path] = dict(
+                    reader.checkpoint(), last_timestamp=last_timestamp, replay_end=self.replays.get(file_path)
+                )
+                checkpointed = True
+            if checkpointed:
+                # Persist the checkpoint in the same transaction as the alert state it led to
+                await state_store.flush()
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {e}", exc_info=True)
+
+    async def rotate_files(self):
+        """Rotate the live files that reached the size limit or the rotation interval."""
+        now = datetime.now()
+        for file_path in find_csv_files(config.DATA_DIR, config.RECURSIVE_WATCH):
+            if file_path not in file_rotations:
+                file_rotations[file_path] = now
+            try:
+                size = os.path.getsize(file_path)
+            except FileNotFoundError:
+                continue
+            too_big = config.ROTATE_MAX_BYTES and size >= config.ROTATE_MAX_BYTES
+            too_old = config.ROTATE_INTERVAL and (now - file_rotations[file_path]).total_seconds() >= config.ROTATE_INTERVAL * 3600
+            if too_big or too_old:
+                await self.rotate(file_path)
+
+    async def rotate(self, file_path):
+        """Move a live file to a segment after reading everything written to it so far."""
+        async with self.lock:
+            await self.read_file(file_path)
+            segment = segment_path(file_path, datetime.now())
+            if os.path.exists(segment) or os.path.exists(f"{segment}.gz"):
+                logger.warning(f"Segment {segment} already exists, not rotating {file_path} yet")
+                return
+            try:
+                if not rotate_file(file_path, segment):
+                    return
+            except OSError as e:
+                logger.error(f"Could not rotate {file_path}: {e}")
+                return
+
+            # The reader keeps following the old file under its new name, the live path starts over
+            reader = self.get_reader(file_path)
+            del self.readers[file_path]
+            reader.file_path = segment
+            self.readers[segment] = reader
+            if file_path in self.replays:
+                self.replays[segment] = self.replays.pop(file_path)
+            self.segments[segment] = {'size': reader.size, 'changed': time.monotonic(), 'warned': time.monotonic()}
+            last_timestamp = file_checkpoints.get(file_path, {}).get('last_timestamp')
+            file_checkpoints[segment] = dict(
+                reader.checkpoint(), last_timestamp=last_timestamp, replay_end=self.replays.get(segment)
+            )
+            # The new live file holds no processed rows, so it is read without skipping any
+            file_checkpoints.pop(file_path, None)
+            file_rotations[file_path] = datetime.now()
+            await state_store.flush()
+            logger.info(f"Rotated {file_path} to {segment}")
+
+    async def finish_segments(self):
+        """Read rows still appended to rotated segments and compress the ones that went quiet."""
+        finished = []
+        async with self.lock:
+            for segment, state in list(self.segments.items()):
+                await self.read_file(segment)
+                reader = self.get_reader(segment)
+                if reader.size != state['size']:
+                    state.update(size=reader.size, changed=time.monotonic())
+                    # A writer that never reopens the file keeps the segment from being compressed
+                    if time.monotonic() - state['warned'] >= config.ROTATE_GRACE * config.SEGMENT_GROWING_WARNING:
+                        state['warned'] = time.monotonic()
+                        logger.warning(
+                            f"Segment {segment} is still growing: the writer keeps {source_path(segment)} open and must "
+                            f"reopen it after rotation, otherwise the segment is never compressed or deleted"
+                        )
+                    continue
+                if time.monotonic() - state['changed'] < config.ROTATE_GRACE:
+                    continue
+                if reader.offset < reader.size:
+                    logger.warning(f"Segment {segment} ends with an unfinished line of {reader.size - reader.offset} bytes")
+                del self.segments[segment]
+                self.readers.pop(segment, None)
+                finished.append((segment, state))
+
+        for segment, state in finished:
+            try:
+                target = await asyncio.to_thread(compress_segment, segment)
+            except OSError as e:
+                logger.error(f"Could not compress segment {segment}: {e}")
+                if os.path.exists(segment):
+                    self.segments[segment] = state
+                else:
+                    file_checkpoints.pop(segment, None)
+                continue
+            file_checkpoints.pop(segment, None)
+            logger.info(f"Compressed segment {segment} to {target}")
+
+    def recover_segments(self):
+        """Pick up the segments that were still being read when the bot stopped."""
+        for segment in find_segments(config.DATA_DIR, config.RECURSIVE_WATCH):
+            if segment not in file_checkpoints:
+                # Rotated right before a restart: the live file's checkpoint may still describe this file
+                source = source_path(segment)
+                checkpoint = file_checkpoints.get(source, {})
+                stat = os.stat(segment)
+                if (checkpoint.get('inode'), checkpoint.get('device')) == (stat.st_ino, stat.st_dev):
+                    file_checkpoints[segment] = checkpoint
+                    file_checkpoints[source] = {'last_timestamp': checkpoint.get('last_timestamp')}
+                else:
+                    file_checkpoints[segment] = {'last_timestamp': checkpoint.get('last_timestamp')}
+            self.segments[segment] = {'size': None, 'changed': time.monotonic(), 'warned': time.monotonic()}
+            logger.info(f"Resuming rotated segment {segment}")
+
+    async def process_rows(self, sensor, df, times):
+        try:
+            logger.info(f"Read {len(df)} new rows for sensor {sensor}")
+            # Formatting the frame is expensive, only do it when debugging
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"DataFrame columns: {df.columns.tolist()}")
+                logger.debug(f"Sample data:\n{df.head()}")
+
+            columns = frame_to_columns(df, times)
+            detector = self.get_anomaly_detector(sensor)
+            get_history_store(sensor).append(columns)
+            if get_recent_window(sensor).append(columns):
+                chart_cache.invalidate(sensor)
+
+            # Only subscribers of this sensor with an active session receive its alerts
+            authenticated_users = [uid for uid in sessions.active if is_subscribed(uid, sensor, user_subscriptions)]
+
+            # The detector runs for every row so its statistics stay current, but only
+            # builds the per-row checks for the settings of subscribers who enabled it
+            anomaly_settings = {}
+            for user_id in authenticated_users:
+                settings = user_anomaly_settings.get(user_id)
+                if settings:
+                    anomaly_settings[user_id] = (settings['zscore'], settings['stuck'])
+            found_by_settings = detector.update(columns, set(anomaly_settings.values()), config.ANOMALY_WARMUP)
+
+            error_monitor = self.get_error_monitor(sensor)
+            error_monitor.add_rows(df, times)
+            error_rate = error_monitor.rate()
+
             current_time = datetime.now()
             
-            # Get all authenticated users with valid sessions
-            authenticated_users = []
-            for uid, state in user_states.items():
-                if state.get('authenticated'):
-                    if 'expires' in state:
-                        if datetime.now() <= state['expires']:
-                            authenticated_users.append(uid)
-                        else:
-                            logger.info(f"User {uid}'s session has expired")
-                            state['authenticated'] = False
-                    else:
-                        authenticated_users.append(uid)
-            
             if not authenticated_users:
-                logger.info("No authenticated users found, skipping threshold checks")
+                logger.info(f"No authenticated subscribers for sensor {sensor}, skipping threshold checks")
                 return
                 
-            logger.info(f"Found {len(authenticated_users)} authenticated users: {authenticated_users}")
+            logger.info(f"Found {len(authenticated_users)} authenticated subscribers")
             
-            # Process file for each authenticated user
-            for user_id in authenticated_users:
-                thresholds = user_thresholds.get(user_id, config.DEFAULT_THRESHOLDS)
-                logger.info(f"Checking thresholds for user {user_id}: {thresholds}")
-                
-                alerts = []
-                
-                # Check temperature
-                temp_out_of_range = (df['Temperature'] < thresholds['temperature']['min']) | (df['Temperature'] > thresholds['temperature']['max'])
-                if temp_out_of_range.any():
-                    out_of_range_values = df[temp_out_of_range]['Temperature'].tolist()
-                    logger.info(f"Temperature alert triggered for user {user_id}. Values out of range: {out_of_range_values}")
-                    logger.info(f"Temperature range: {thresholds['temperature']['min']} - {thresholds['temperature']['max']}")
-                    alerts.append(f"⚠️ Temperature out of range! Values: {out_of_range_values}")
-                
-                # Check humidity
-                hum_out_of_range = (df['Humidity'] < thresholds['humidity']['min']) | (df['Humidity'] > thresholds['humidity']['max'])
-                if hum_out_of_range.any():
-                    out_of_range_values = df[hum_out_of_range]['Humidity'].tolist()
-                    logger.info(f"Humidity alert triggered for user {user_id}. Values out of range: {out_of_range_values}")
-                    logger.info(f"Humidity range: {thresholds['humidity']['min']} - {thresholds['humidity']['max']}")
-                    alerts.append(f"⚠️ Humidity out of range! Values: {out_of_range_values}")
-                
-                # Check light
-                light_out_of_range = (df['Light'] < thresholds['light']['min']) | (df['Light'] > thresholds['light']['max'])
-                if light_out_of_range.any():
-                    out_of_range_values = df[light_out_of_range]['Light'].tolist()
-                    logger.info(f"Light alert triggered for user {user_id}. Values out of range: {out_of_range_values}")
-                    logger.info(f"Light range: {thresholds['light']['min']} - {thresholds['light']['max']}")
-                    alerts.append(f"⚠️ Light intensity out of range! Values: {out_of_range_values}")
-                
-                # If there are alerts, check frequency and send
-                if alerts:
+            # Evaluate the new rows for all subscribers at once
+            evaluation_started = time.perf_counter()
+            thresholds_by_user = {
+                user_id: resolve_thresholds(user_id, sensor, user_sensor_thresholds, user_thresholds, config.DEFAULT_THRESHOLDS)
+                for user_id in authenticated_users
+            }
+            violators = self.engine.evaluate(df, thresholds_by_user)
+
+            # Advance the episodes of users with new violations or an episode still open
+            candidates = {
+                user_id: thresholds_by_user[user_id] for user_id in authenticated_users
+                if user_id in violators or user_states[user_id].get('episodes', {}).get(sensor)
+            }
+            episodes_by_user = {
+                user_id: user_states[user_id].setdefault('episodes', {}).setdefault(sensor, {})
+                for user_id in candidates
+            }
+            changes_by_user = self.episodes.update(df, times, candidates, episodes_by_user) if candidates else {}
+
+            # Notify on episodes opening or closing, and summarize open ones every alert interval
+            alerts_by_user = {}
+            notified_by_user = {}
+            lines = {}
+            for user_id, changes in changes_by_user.items():
+                user_states.touch(user_id)
+                frequency = user_alert_frequencies.get(user_id, config.DEFAULT_ALERT_FREQUENCY)
+                for key, _, label in METRICS:
+                    change = changes.get(key)
+                    if change is None:
+                        continue
+                    episode = episodes_by_user[user_id].get(key)
+                    if not change['opened'] and change['closed_at'] is None:
+                        notified = episode.get('notified')
+                        if notified and (current_time - notified).total_seconds() < frequency * 60:
+                            metrics.ALERTS_SUPPRESSED.inc()
+                            continue
+                    thresholds = thresholds_by_user[user_id][key]
+                    # Changes are shared between users in the same state, format each once
+                    line_key = (id(change), thresholds['min'], thresholds['max'])
+                    if line_key not in lines:
+                        lines[line_key] = format_episode(label, change, thresholds['min'], thresholds['max'])
+                    alerts_by_user.setdefault(user_id, [f"📍 Sensor {sensor}"]).append(lines[line_key])
+                    if episode is not None:
+                        notified_by_user.setdefault(user_id, []).append(episode)
+
+            # Report anomalies to users who enabled detection
+            anomaly_alerts = {}
+            for user_id, settings_key in anomaly_settings.items():
+                found = found_by_settings[settings_key]
+                if not found:
+                    continue
+                frequency = user_alert_frequencies.get(user_id, config.DEFAULT_ALERT_FREQUENCY)
+                last_anomalies = user_states[user_id].get('last_anomalies', {}).get(sensor, {})
+                for key, _, label in METRICS:
+                    for kind, summary in found.get(key, {}).items():
+                        name = f"{key}:{kind}"
+                        last_alert = last_anomalies.get(name)
+                        if last_alert and (current_time - last_alert).total_seconds() < frequency * 60:
+                            metrics.ALERTS_SUPPRESSED.inc()
+                            continue
+                        alerts_by_user.setdefault(user_id, [f"📍 Sensor {sensor}"]).append(format_anomaly(label, kind, summary))
+                        anomaly_alerts.setdefault(user_id, []).append(name)
+
+            # Check the missing-reading rate against each user's limit
+            error_alerts = set()
+            if error_monitor.total_count >= config.ERROR_RATE_MIN_ROWS:
+                for user_id in authenticated_users:
+                    limit = user_error_rates.get(user_id, config.DEFAULT_ERROR_RATE)
+                    if error_rate <= limit:
+                        continue
                     frequency = user_alert_frequencies.get(user_id, config.DEFAULT_ALERT_FREQUENCY)
-                    last_alert = user_states[user_id].get('last_alert')
-                    
-                    if not last_alert or (current_time - last_alert).total_seconds() >= frequency * 60:
-                        message = "\n".join(alerts)
-                        logger.info(f"Sending alerts to user {user_id}: {message}")
-                        await self.app.bot.send_message(chat_id=user_id, text=message)
-                        user_states[user_id]['last_alert'] = current_time
-                    else:
-                        logger.info(f"Alert frequency not met for user {user_id}, skipping")
-                else:
-                    logger.info(f"No alerts triggered for user {user_id}")
+                    last_alert = user_states[user_id].get('last_alerts', {}).get(sensor)
+                    if last_alert and (current_time - last_alert).total_seconds() < frequency * 60:
+                        metrics.ALERTS_SUPPRESSED.inc()
+                        continue
+                    alerts_by_user.setdefault(user_id, [f"📍 Sensor {sensor}"]).append(
+                        f"⚠️ Sensor error rate {error_rate:.1f}% over the last {config.ERROR_RATE_WINDOW} minutes "
+                        f"exceeds your limit of {limit}%"
+                    )
+                    error_alerts.add(user_id)
+            metrics.EVALUATION_SECONDS.observe(time.perf_counter() - evaluation_started)
 
-        except Exception as e:
-            logger.error(f"Error processing file {file_path}: {e}", exc_info=True)
+            if not alerts_by_user:
+                logger.info("No alerts triggered")
+                return
 
-    def check_thresholds(self, df, thresholds):
-        alerts = []
-        logger.info(f"Starting threshold check with thresholds: {thresholds}")
-        logger.info(f"DataFrame columns: {df.columns.tolist()}")
-        logger.info(f"Sample data:\n{df.head()}")
-        
-        # Check temperature
-        temp_out_of_range = (df['Temperature'] < thresholds['temperature']['min']) | (df['Temperature'] > thresholds['temperature']['max'])
-        if temp_out_of_range.any():
-            out_of_range_values = df[temp_out_of_range]['Temperature'].tolist()
-            logger.info(f"Temperature alert triggered. Values out of range: {out_of_range_values}")
-            logger.info(f"Temperature range: {thresholds['temperature']['min']} - {thresholds['temperature']['max']}")
-            alerts.append(f"Temperature out of range! Values: {out_of_range_values}")
-        
-        # Check humidity
-        hum_out_of_range = (df['Humidity'] < thresholds['humidity']['min']) | (df['Humidity'] > thresholds['humidity']['max'])
-        if hum_out_of_range.any():
-            out_of_range_values = df[hum_out_of_range]['Humidity'].tolist()
-            logger.info(f"Humidity alert triggered. Values out of range: {out_of_range_values}")
-            logger.info(f"Humidity range: {thresholds['humidity']['min']} - {thresholds['humidity']['max']}")
-            alerts.append(f"Humidity out of range! Values: {out_of_range_values}")
-        
-        # Check light
-        light_out_of_range = (df['Light'] < thresholds['light']['min']) | (df['Light'] > thresholds['light']['max'])
-        if light_out_of_range.any():
-            out_of_range_values = df[light_out_of_range]['Light'].tolist()
-            logger.info(f"Light alert triggered. Values out of range: {out_of_range_values}")
-            logger.info(f"Light range: {thresholds['light']['min']} - {thresholds['light']['max']}")
-            alerts.append(f"Light intensity out of range! Values: {out_of_range_values}")
-        
-        logger.info(f"Threshold check completed. Found {len(alerts)} alerts")
-        return alerts
+            for user_id, alerts in alerts_by_user.items():
+                message = "\n".join(alerts)
+                logger.debug(f"Queueing alerts for user {user_id}: {message}")
+                if not self.dispatcher.submit(user_id, message):
+                    continue
+                metrics.ALERTS_PRODUCED.inc()
+                for episode in notified_by_user.get(user_id, []):
+                    episode['notified'] = current_time
+                if user_id in error_alerts:
+                    user_states[user_id].setdefault('last_alerts', {})[sensor] = current_time
+                for name in anomaly_alerts.get(user_id, []):
+                    user_states[user_id].setdefault('last_anomalies', {}).setdefault(sensor, {})[name] = current_time
+                user_states.touch(user_id)
+
+        except Exception as e:
+            logger.error(f"Error processing rows for sensor {sensor}: {e}", exc_info=True)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"User {user.id} ({user.username}) started the bot")
-    user_states[user.id] = {'authenticated': False}
     
     # Remove @ from username if present
     username = user.username.lstrip('@') if user.username else None
     
     if username and username in config.WHITELISTED_USERS:
-        user_states[user.id] = {
-            'authenticated': True,
-            'expires': datetime.now() + timedelta(minutes=config.LOGIN_EXPIRATION)
-        }
+        sessions.login(user.id)
         logger.info(f"User {user.id} ({username}) is whitelisted")
         await update.message.reply_text(
             f"Welcome {user.first_name}! You are whitelisted and have full access."
         )
     else:
+        sessions.logout(user.id)
         logger.info(f"User {user.id} ({username}) needs to login")
         await update.message.reply_text(
             f"Welcome {user.first_name}! Please use /login to authenticate."
@@ -182,17 +572,32 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "I am a sensor monitoring bot. I can:\n"
         "- Monitor sensor data from CSV files\n"
-        "- Alert you when values are out of range\n"
+        "- Alert you when values go out of range and when they are back in range\n"
         "- Let you set custom thresholds\n"
         "- Adjust alert frequency\n\n"
         "Available commands:\n"
         "• /start - Start the bot and check authentication\n"
         "• /help - Show this help message\n"
         "• /login - Start the login process\n"
-        "• /setrange temp_min temp_max hum_min hum_max light_min light_max - Set custom thresholds\n"
+        "• /setrange [sensor] temp_min temp_max hum_min hum_max light_min light_max - Set custom thresholds\n"
         "   Example: /setrange 15 30 0.3 0.9 1000 3000\n"
-        "• /setalert minutes - Set alert frequency in minutes\n"
-        "   Example: /setalert 60\n\n"
+        "   Example for one sensor: /setrange chamber-3 15 30 0.3 0.9 1000 3000\n"
+        "• /sensors - List known sensors\n"
+        "• /subscribe sensor [sensor ...] - Only receive alerts for these sensors\n"
+        "• /unsubscribe [sensor ...] - Remove subscriptions (none left means all sensors)\n"
+        "• /setalert minutes - Set how often ongoing out-of-range episodes are summarized\n"
+        "   Example: /setalert 60\n"
+        "• /seterror percent - Set the maximum share of rows with missing readings\n"
+        "   Example: /seterror 5\n"
+        "• /setanomaly on|off|zscore stuck_minutes - Report jumps, implausibly fast changes and stuck readings\n"
+        "   Example: /setanomaly 4 30\n"
+        "• /stats - Show current sensor error rates\n"
+        "• /history metric duration [sensor] - Show recent min/avg/max values\n"
+        "   Example: /history temperature 24h\n"
+        "• /chart metric duration [sensor] - Plot recent values\n"
+        "   Example: /chart humidity 7d\n\n"
+        "Each CSV file in the data directory is a sensor named after the file, "
+        "or after its subdirectory when files are grouped per sensor.\n\n"
         "CSV File Format:\n"
         "The bot expects CSV files with columns: Time, Temperature, Humidity, Light\n"
         "Example:\n"
@@ -215,9 +620,10 @@ async def login(update: Update, context: ContextTypes.DEFAULT_TYPE):
         login_attempts[user.id] = 0
         logger.debug(f"Initialized login attempts for user {user.id}")
 
-    if login_attempts[user.id] >= config.MAX_LOGIN_ATTEMPTS:
+    remaining = lockout_remaining(user.id)
+    if remaining:
         logger.warning(f"User {user.id} exceeded maximum login attempts")
-        await update.message.reply_text("Too many failed attempts. Please try again later.")
+        await update.message.reply_text(f"Too many failed attempts. Please try again in {remaining} minutes.")
         return
 
     logger.info(f"Requesting login code from user {user.id}")
@@ -242,12 +648,15 @@ async def verify_login(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please use /login first.")
         return
 
+    remaining = lockout_remaining(user.id)
+    if remaining:
+        logger.warning(f"Login verification by locked out user {user.id}")
+        await update.message.reply_text(f"Too many failed attempts. Please try again in {remaining} minutes.")
+        return
+
     if update.message.text == config.LOGIN_CODE:
         logger.info(f"User {user.id} ({username}) successfully logged in")
-        user_states[user.id] = {
-            'authenticated': True,
-            'expires': datetime.now() + timedelta(minutes=config.LOGIN_EXPIRATION)
-        }
+        sessions.login(user.id)
         login_attempts[user.id] = 0
         await update.message.reply_text(
             f"Login successful! Your session will expire in {config.LOGIN_EXPIRATION} minutes."
@@ -261,52 +670,65 @@ async def verify_login(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"Invalid code. {remaining_attempts} attempts remaining."
             )
         else:
-            await update.message.reply_text("Too many failed attempts. Please try again later.")
+            login_lockouts[user.id] = datetime.now()
+            await update.message.reply_text(
+                f"Too many failed attempts. Please try again in {config.LOGIN_LOCKOUT} minutes."
+            )
 
 async def set_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"Set range attempt by user {user.id} ({user.username})")
     
-    if not user_states.get(user.id, {}).get('authenticated'):
+    if user.id not in sessions:
         logger.warning(f"Unauthorized set_range attempt by user {user.id}")
         await update.message.reply_text("Please authenticate first using /login")
         return
 
-    if len(context.args) != 6:
+    if len(context.args) not in (6, 7):
         logger.warning(f"Invalid set_range arguments by user {user.id}: {context.args}")
         await update.message.reply_text(
             "Please provide all threshold values in the format:\n"
-            "/setrange temp_min temp_max hum_min hum_max light_min light_max\n"
-            "Example: /setrange 15 30 0.3 0.9 1000 3000"
+            "/setrange [sensor] temp_min temp_max hum_min hum_max light_min light_max\n"
+            "Example: /setrange 15 30 0.3 0.9 1000 3000\n"
+            "Example for one sensor: /setrange chamber-3 15 30 0.3 0.9 1000 3000"
         )
         return
 
+    sensor = context.args[0] if len(context.args) == 7 else None
+    values = context.args[-6:]
     try:
         thresholds = {
             'temperature': {
-                'min': float(context.args[0]),
-                'max': float(context.args[1])
+                'min': float(values[0]),
+                'max': float(values[1])
             },
             'humidity': {
-                'min': float(context.args[2]),
-                'max': float(context.args[3])
+                'min': float(values[2]),
+                'max': float(values[3])
             },
             'light': {
-                'min': float(context.args[4]),
-                'max': float(context.args[5])
+                'min': float(values[4]),
+                'max': float(values[5])
             }
         }
-        user_thresholds[user.id] = thresholds
-        logger.info(f"User {user.id} updated thresholds: {thresholds}")
-        
-        # Process the file immediately after setting thresholds
-        data_file = Path(config.DATA_DIR) / "data.csv"
-        if data_file.exists():
-            logger.info(f"Processing file after threshold update for user {user.id}")
-            event_handler = CSVHandler(context.application)
-            await event_handler.process_file(str(data_file))
+        if sensor:
+            user_sensor_thresholds.setdefault(user.id, {})[sensor] = thresholds
+            user_sensor_thresholds.touch(user.id)
+            logger.info(f"User {user.id} updated thresholds for sensor {sensor}: {thresholds}")
+        else:
+            user_thresholds[user.id] = thresholds
+            threshold_index.update(user.id, thresholds)
+            logger.info(f"User {user.id} updated thresholds: {thresholds}")
         
-        await update.message.reply_text("Thresholds updated successfully!")
+        if sensor:
+            message = f"Thresholds for sensor {sensor} updated successfully!"
+        else:
+            message = "Thresholds updated successfully!"
+        # Check the new range against recent readings in memory, only for this user
+        check = check_new_range(user.id, sensor, thresholds)
+        if check:
+            message += f"\n\n{check}"
+        await update.message.reply_text(message)
     except ValueError as e:
         logger.error(f"Invalid threshold values by user {user.id}: {context.args}", exc_info=True)
         await update.message.reply_text("Please provide valid numbers for all thresholds.")
@@ -315,7 +737,7 @@ async def set_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"Set alert attempt by user {user.id} ({user.username})")
     
-    if not user_states.get(user.id, {}).get('authenticated'):
+    if user.id not in sessions:
         logger.warning(f"Unauthorized set_alert attempt by user {user.id}")
         await update.message.reply_text("Please authenticate first using /login")
         return
@@ -338,11 +760,240 @@ async def set_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Invalid frequency value by user {user.id}: {context.args[0]}", exc_info=True)
         await update.message.reply_text("Please provide a valid number of minutes.")
 
+async def set_error(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Set error rate attempt by user {user.id} ({user.username})")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized set_error attempt by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    if len(context.args) != 1:
+        logger.warning(f"Invalid set_error arguments by user {user.id}: {context.args}")
+        await update.message.reply_text("Please provide the maximum error rate in percent: /seterror <percent>")
+        return
+
+    try:
+        limit = float(context.args[0])
+        if not 0 <= limit <= 100:
+            logger.warning(f"Invalid error rate value by user {user.id}: {limit}")
+            await update.message.reply_text("Error rate must be between 0 and 100 percent.")
+            return
+        user_error_rates[user.id] = limit
+        logger.info(f"User {user.id} set error rate limit to {limit}%")
+        await update.message.reply_text(f"Error rate limit set to {limit}%.")
+    except ValueError as e:
+        logger.error(f"Invalid error rate value by user {user.id}: {context.args[0]}", exc_info=True)
+        await update.message.reply_text("Please provide a valid percentage.")
+
+async def set_anomaly(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Set anomaly attempt by user {user.id} ({user.username}): {context.args}")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized set_anomaly attempt by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    usage = (
+        "Please use /setanomaly on, /setanomaly off or /setanomaly <zscore> <stuck_minutes>\n"
+        f"Example: /setanomaly {config.ANOMALY_ZSCORE:g} {config.ANOMALY_STUCK_MINUTES}"
+    )
+    if len(context.args) == 1 and context.args[0].lower() == 'off':
+        user_anomaly_settings.pop(user.id, None)
+        logger.info(f"User {user.id} turned anomaly alerts off")
+        await update.message.reply_text("Anomaly alerts turned off.")
+        return
+    if len(context.args) == 1 and context.args[0].lower() == 'on':
+        zscore, stuck = config.ANOMALY_ZSCORE, config.ANOMALY_STUCK_MINUTES
+    elif len(context.args) == 2:
+        try:
+            zscore, stuck = float(context.args[0]), int(context.args[1])
+        except ValueError:
+            logger.warning(f"Invalid set_anomaly values by user {user.id}: {context.args}")
+            await update.message.reply_text("Please provide a number for the z-score and whole minutes.\n" + usage)
+            return
+        if zscore <= 0 or stuck < 1:
+            await update.message.reply_text("The z-score must be positive and the stuck time at least 1 minute.")
+            return
+    else:
+        await update.message.reply_text(usage)
+        return
+
+    user_anomaly_settings[user.id] = {'zscore': zscore, 'stuck': stuck}
+    logger.info(f"User {user.id} set anomaly alerts to z-score {zscore}, stuck after {stuck} minutes")
+    await update.message.reply_text(
+        f"Anomaly alerts on: readings more than {zscore:g} standard deviations from the recent mean, "
+        f"changes faster than expected for the metric, and readings unchanged for {stuck} minutes."
+    )
+
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Subscribe attempt by user {user.id} ({user.username}): {context.args}")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized subscribe attempt by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    if not context.args:
+        await update.message.reply_text(
+            "Please provide one or more sensors: /subscribe <sensor> [sensor ...]\n"
+            "Use /sensors to list the known sensors."
+        )
+        return
+
+    sensors = sorted(set(user_subscriptions.get(user.id, [])) | set(context.args))
+    user_subscriptions[user.id] = sensors
+    logger.info(f"User {user.id} subscribed to sensors: {sensors}")
+    await update.message.reply_text(f"You will receive alerts for: {', '.join(sensors)}")
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Unsubscribe attempt by user {user.id} ({user.username}): {context.args}")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized unsubscribe attempt by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    if not context.args:
+        user_subscriptions.pop(user.id, None)
+        await update.message.reply_text("Subscriptions cleared. You will receive alerts for all sensors.")
+        return
+
+    sensors = [sensor for sensor in user_subscriptions.get(user.id, []) if sensor not in context.args]
+    if sensors:
+        user_subscriptions[user.id] = sensors
+        await update.message.reply_text(f"You will receive alerts for: {', '.join(sensors)}")
+    else:
+        user_subscriptions.pop(user.id, None)
+        await update.message.reply_text("No subscriptions left. You will receive alerts for all sensors.")
+    logger.info(f"User {user.id} unsubscribed from sensors: {context.args}")
+
+async def list_sensors(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Sensor list requested by user {user.id} ({user.username})")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized sensor list request by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    event_handler = context.application.bot_data.get('csv_handler')
+    known = sorted(set(event_handler.sensors.values())) if event_handler else []
+    if not known:
+        await update.message.reply_text("No sensors have been seen yet.")
+        return
+    lines = ["Known sensors:"]
+    for sensor in known:
+        marker = "✅" if is_subscribed(user.id, sensor, user_subscriptions) else "▫️"
+        lines.append(f"{marker} {sensor}")
+    await update.message.reply_text("\n".join(lines))
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    logger.info(f"Stats requested by user {user.id} ({user.username})")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized stats request by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return
+
+    event_handler = context.application.bot_data.get('csv_handler')
+    if not event_handler or not event_handler.error_monitors:
+        await update.message.reply_text("No sensor data has been processed yet.")
+        return
+
+    limit = user_error_rates.get(user.id, config.DEFAULT_ERROR_RATE)
+    lines = [f"Sensor error rates over the last {config.ERROR_RATE_WINDOW} minutes (limit {limit}%):"]
+    for sensor, monitor in sorted(event_handler.error_monitors.items()):
+        lines.append(
+            f"{sensor}: {monitor.rate():.1f}% "
+            f"({monitor.missing_count} of {monitor.total_count} rows missing readings)"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+async def parse_trend_args(update: Update, context: ContextTypes.DEFAULT_TYPE, command):
+    user = update.effective_user
+    logger.info(f"/{command} requested by user {user.id} ({user.username}): {context.args}")
+
+    if user.id not in sessions:
+        logger.warning(f"Unauthorized {command} request by user {user.id}")
+        await update.message.reply_text("Please authenticate first using /login")
+        return None
+
+    if len(context.args) not in (2, 3) or context.args[0].lower() not in METRIC_NAMES:
+        await update.message.reply_text(
+            f"Please provide a metric and a duration: /{command} <temperature|humidity|light> <duration> [sensor]\n"
+            f"Example: /{command} temperature 24h"
+        )
+        return None
+
+    try:
+        duration = parse_duration(context.args[1])
+    except ValueError:
+        await update.message.reply_text("Please provide a duration like 30m, 6h, 7d or 2w.")
+        return None
+
+    sources = [name for name, window in recent_windows.items() if len(window)]
+    if not sources:
+        await update.message.reply_text("No sensor data has been processed yet.")
+        return None
+    if len(context.args) == 3:
+        source = context.args[2]
+        if source not in sources:
+            await update.message.reply_text(f"No data for sensor {source}. Known sensors: {', '.join(sorted(sources))}")
+            return None
+    else:
+        # Use the sensor with the most recent readings
+        source = max(sources, key=lambda name: recent_windows[name].last_timestamp)
+    return source, METRIC_NAMES[context.args[0].lower()], duration, context.args[1]
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = await parse_trend_args(update, context, 'history')
+    if not args:
+        return
+    source, (column, label, unit), duration, duration_text = args
+
+    key = (source, column, duration, config.HISTORY_TEXT_BUCKETS, 'text')
+    version = recent_windows[source].version
+    text = chart_cache.get(key, version)
+    if text is None:
+        readings = get_readings(source, column, duration)
+        text = format_history(label, unit, duration_text, readings, config.HISTORY_TEXT_BUCKETS)
+        chart_cache.put(key, version, text)
+    await update.message.reply_text(f"📍 Sensor {source}\n{text}")
+
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = await parse_trend_args(update, context, 'chart')
+    if not args:
+        return
+    source, (column, label, unit), duration, duration_text = args
+
+    key = (source, column, duration, config.CHART_POINTS, 'png')
+    version = recent_windows[source].version
+    image = chart_cache.get(key, version)
+    if image is None:
+        readings = get_readings(source, column, duration)
+        if not len(readings['time']):
+            await update.message.reply_text(f"No {label.lower()} readings in the last {duration_text}.")
+            return
+        try:
+            image = await asyncio.to_thread(render_chart, label, unit, duration_text, readings, config.CHART_POINTS)
+        except RuntimeError as e:
+            logger.error(f"Could not render chart: {e}")
+            await update.message.reply_text("Charts are not available on this server, use /history instead.")
+            return
+        chart_cache.put(key, version, image)
+    await update.message.reply_photo(photo=image, caption=f"{label}, last {duration_text} (sensor {source})")
+
 async def current_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"Current settings requested by user {user.id} ({user.username})")
     
-    if not user_states.get(user.id, {}).get('authenticated'):
+    if user.id not in sessions:
         logger.warning(f"Unauthorized current settings request by user {user.id}")
         await update.message.reply_text("Please authenticate first using /login")
         return
@@ -350,6 +1001,12 @@ async def current_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get user's thresholds or use defaults
     thresholds = user_thresholds.get(user.id, config.DEFAULT_THRESHOLDS)
     frequency = user_alert_frequencies.get(user.id, config.DEFAULT_ALERT_FREQUENCY)
+    error_limit = user_error_rates.get(user.id, config.DEFAULT_ERROR_RATE)
+    anomaly_settings = user_anomaly_settings.get(user.id)
+    if anomaly_settings:
+        anomalies = f"z-score {anomaly_settings['zscore']:g}, stuck after {anomaly_settings['stuck']} minutes"
+    else:
+        anomalies = "off"
     
     # Format the message
     message = (
@@ -357,11 +1014,134 @@ async def current_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Temperature Range: {thresholds['temperature']['min']} - {thresholds['temperature']['max']}°C\n"
         f"Humidity Range: {thresholds['humidity']['min']} - {thresholds['humidity']['max']}\n"
         f"Light Range: {thresholds['light']['min']} - {thresholds['light']['max']}\n"
+        f"Error Rate Limit: {error_limit}%\n"
+        f"Anomaly Alerts: {anomalies}\n"
         f"Alert Frequency: Every {frequency} minutes"
     )
+    for sensor, sensor_thresholds in sorted(user_sensor_thresholds.get(user.id, {}).items()):
+        message += (
+            f"\n\nSensor {sensor}:\n"
+            f"Temperature Range: {sensor_thresholds['temperature']['min']} - {sensor_thresholds['temperature']['max']}°C\n"
+            f"Humidity Range: {sensor_thresholds['humidity']['min']} - {sensor_thresholds['humidity']['max']}\n"
+            f"Light Range: {sensor_thresholds['light']['min']} - {sensor_thresholds['light']['max']}"
+        )
+    subscriptions = user_subscriptions.get(user.id)
+    message += f"\n\nSubscribed Sensors: {', '.join(subscriptions) if subscriptions else 'all'}"
     
     await update.message.reply_text(message)
 
+async def start_state_store(application: Application):
+    state_store.open(SQLiteStateBackend(config.STATE_DB))
+    threshold_index.rebuild(user_thresholds)
+    sessions.load()
+    state_store.start()
+    logger.info(f"State store opened: {config.STATE_DB}")
+
+async def start_alert_dispatcher(application: Application):
+    dispatcher = AlertDispatcher(
+        application.bot,
+        workers=config.ALERT_SENDER_TASKS,
+        max_pending=config.ALERT_OUTBOX_SIZE,
+        global_rate=config.TELEGRAM_GLOBAL_RATE,
+        chat_rate=config.TELEGRAM_CHAT_RATE,
+        max_retries=config.ALERT_SEND_RETRIES
+    )
+    dispatcher.start()
+    metrics.ALERTS_PENDING.set_function(lambda: dispatcher.pending_count)
+    application.bot_data['dispatcher'] = dispatcher
+    sessions.start(application.job_queue, notify=dispatcher.submit)
+
+async def start_file_watcher(application: Application):
+    bridge = FileEventBridge(window=config.EVENT_COALESCE_WINDOW)
+    bridge.bind(asyncio.get_running_loop())
+    # Parsing large backlogs happens in separate processes to keep the event loop responsive
+    executor = ProcessPoolExecutor(
+        max_workers=config.PARSE_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+    application.bot_data['executor'] = executor
+    event_handler = CSVHandler(application, bridge, application.bot_data['dispatcher'], executor)
+    application.bot_data['event_bridge'] = bridge
+    metrics.FILE_EVENTS_QUEUED.set_function(bridge.queue.qsize)
+    application.bot_data['csv_handler'] = event_handler
+    application.bot_data['event_consumer'] = asyncio.create_task(bridge.run(event_handler.process_file))
+    application.bot_data['retention_task'] = asyncio.create_task(run_retention(event_handler))
+
+    # Start the CSV file watcher
+    observer = Observer()
+    observer.schedule(event_handler, config.DATA_DIR, recursive=config.RECURSIVE_WATCH)
+    observer.start()
+    application.bot_data['observer'] = observer
+    logger.info(f"CSV file watcher started in directory: {config.DATA_DIR} (recursive: {config.RECURSIVE_WATCH})")
+
+    # Forget checkpoints of files that are gone, then catch up on the files that exist
+    for file_path in [path for path in file_checkpoints if not os.path.exists(path)]:
+        del file_checkpoints[file_path]
+    for file_path in [path for path in file_rotations if not os.path.exists(path)]:
+        del file_rotations[file_path]
+    event_handler.recover_segments()
+    for data_file in find_csv_files(config.DATA_DIR, config.RECURSIVE_WATCH):
+        logger.info(f"Found existing data file: {data_file}")
+        event_handler.load_sensor(data_file)
+        bridge.submit(data_file)
+    for segment in event_handler.segments:
+        bridge.submit(segment)
+
+async def stop_file_watcher(application: Application):
+    observer = application.bot_data.get('observer')
+    if observer:
+        observer.stop()
+        observer.join()
+        logger.info("CSV file watcher stopped")
+    for name in ('retention_task', 'event_consumer'):
+        task = application.bot_data.get(name)
+        if task:
+            task.cancel()
+    executor = application.bot_data.get('executor')
+    if executor:
+        executor.shutdown(cancel_futures=True)
+
+async def run_retention(event_handler):
+    """Rotate live files, finish rotated segments and delete expired ones on a fixed interval."""
+    while True:
+        await asyncio.sleep(config.RETENTION_CHECK_INTERVAL)
+        try:
+            await event_handler.rotate_files()
+            await event_handler.finish_segments()
+            await asyncio.to_thread(
+                delete_expired, config.DATA_DIR, config.RECURSIVE_WATCH, config.SEGMENT_RETENTION_DAYS * 86400
+            )
+        except Exception as e:
+            logger.error(f"Error during file retention: {e}", exc_info=True)
+
+async def start_metrics_server(application: Application):
+    if not config.METRICS_PORT:
+        return
+    try:
+        application.bot_data['metrics_server'] = await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)
+    except OSError as e:
+        logger.error(f"Could not start the metrics endpoint on {config.METRICS_HOST}:{config.METRICS_PORT}: {e}")
+
+async def post_init(application: Application):
+    await start_state_store(application)
+    await start_alert_dispatcher(application)
+    await start_file_watcher(application)
+    await start_metrics_server(application)
+
+async def post_shutdown(application: Application):
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await stop_file_watcher(application)
+    sessions.stop()
+    dispatcher = application.bot_data.get('dispatcher')
+    if dispatcher:
+        await dispatcher.stop()
+    await state_store.stop()
+    for store in history_stores.values():
+        store.close()
+
 def main():
     logger.info("Starting bot initialization")
     # Create data directory if it doesn't exist
@@ -369,7 +1149,16 @@ def main():
     logger.info(f"Data directory created/verified: {config.DATA_DIR}")
 
     # Initialize bot
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if config.TELEGRAM_API_URL:
+        api_url = config.TELEGRAM_API_URL.rstrip('/')
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    application = builder.build()
     logger.info("Bot application initialized")
 
     # Add handlers
@@ -378,26 +1167,35 @@ def main():
     application.add_handler(CommandHandler("login", login))
     application.add_handler(CommandHandler("setrange", set_range))
     application.add_handler(CommandHandler("setalert", set_alert))
+    application.add_handler(CommandHandler("seterror", set_error))
+    application.add_handler(CommandHandler("setanomaly", set_anomaly))
+    application.add_handler(CommandHandler("subscribe", subscribe))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe))
+    application.add_handler(CommandHandler("sensors", list_sensors))
+    application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("chart", chart_command))
     application.add_handler(CommandHandler("current", current_settings))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, verify_login))
     logger.info("Command handlers registered")
 
-    # Start the CSV file watcher
-    event_handler = CSVHandler(application)
-    observer = Observer()
-    observer.schedule(event_handler, config.DATA_DIR, recursive=False)
-    observer.start()
-    logger.info(f"CSV file watcher started in directory: {config.DATA_DIR}")
-
-    # Check if data.csv exists and process it
-    data_file = Path(config.DATA_DIR) / "data.csv"
-    if data_file.exists():
-        logger.info(f"Found existing data file: {data_file}")
-        event_handler.process_file(str(data_file))
-
     # Start the bot
-    logger.info("Starting bot polling")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if config.WEBHOOK_URL:
+        webhook_url = f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}"
+        logger.info(f"Starting webhook on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT} for {webhook_url}")
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=config.WEBHOOK_SECRET or None,
+            cert=config.WEBHOOK_CERT or None,
+            key=config.WEBHOOK_KEY or None,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        logger.info("Starting bot polling")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,105 @@
+import io
+import re
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from downsample import minmax_buckets
+
+logger = logging.getLogger(__name__)
+
+try:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.dates as mdates
+except ImportError:
+    Figure = None
+
+# Accepted metric names mapped to (history column, label, unit)
+METRIC_NAMES = {
+    'temperature': ('temperature', 'Temperature', '°C'),
+    'temp': ('temperature', 'Temperature', '°C'),
+    'humidity': ('humidity', 'Humidity', ''),
+    'hum': ('humidity', 'Humidity', ''),
+    'light': ('light', 'Light', ''),
+}
+
+DURATION_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text):
+    """Parse durations like 30m, 6h, 7d or 2w into seconds."""
+    match = re.fullmatch(r'(\d+)\s*([mhdw])', text.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration: {text}")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+@lru_cache(maxsize=4096)
+def format_time(timestamp):
+    return np.datetime64(int(timestamp), 's').astype(object).strftime('%m-%d %H:%M')
+
+
+def format_history(label, unit, duration, readings, buckets):
+    times, mins, means, maxs = minmax_buckets(readings['time'], readings['values'], buckets)
+    if not len(times):
+        return f"No {label.lower()} readings in the last {duration}."
+    lines = [f"{label} over the last {duration} ({len(readings['time'])} readings):"]
+    for timestamp, low, mean, high in zip(times, mins, means, maxs):
+        if np.isnan(mean):
+            lines.append(f"{format_time(timestamp)}  no readings")
+        else:
+            lines.append(f"{format_time(timestamp)}  min {low:.2f}  avg {mean:.2f}  max {high:.2f}{unit}")
+    return "\n".join(lines)
+
+
+def render_chart(label, unit, duration, readings, points):
+    """Render a min/max envelope with the bucket mean as a PNG."""
+    if Figure is None:
+        raise RuntimeError("matplotlib is not installed")
+    times, mins, means, maxs = minmax_buckets(readings['time'], readings['values'], points)
+    dates = times.astype('datetime64[s]')
+    figure = Figure(figsize=(8, 3.5), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.fill_between(dates, mins, maxs, alpha=0.3, linewidth=0, label='min/max')
+    axes.plot(dates, means, linewidth=1, label='mean')
+    axes.set_title(f"{label}, last {duration}")
+    axes.set_ylabel(f"{label} ({unit})" if unit else label)
+    axes.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
+    axes.legend(loc='upper left')
+    axes.grid(alpha=0.3)
+    figure.autofmt_xdate()
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+class ChartCache:
+    """Rendered results keyed by (source, metric, range, buckets) and tagged with the data version."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value):
+        self.entries[key] = (version, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, source):
+        for key in [key for key in self.entries if key[0] == source]:
+            del self.entries[key]
@@ -7,6 +7,20 @@ load_dotenv()
 # Telegram Bot Token
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# Bot API server, e.g. a self-hosted one (default: api.telegram.org)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+
+# Webhook mode: set WEBHOOK_URL to the public base URL Telegram should post updates to,
+# otherwise the bot uses long polling. The local server listens on WEBHOOK_LISTEN:WEBHOOK_PORT
+# at WEBHOOK_PATH, checks WEBHOOK_SECRET if set and serves TLS when a certificate is given.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT', '')
+WEBHOOK_KEY = os.getenv('WEBHOOK_KEY', '')
+
 # Default thresholds
 DEFAULT_THRESHOLDS = {
     'temperature': {'min': 15, 'max': 30},
@@ -14,15 +28,127 @@ DEFAULT_THRESHOLDS = {
     'light': {'min': 1000, 'max': 3000}
 }
 
+# Number of users with custom thresholds from which violators are looked up
+# through the sorted threshold index instead of the grouped broadcast
+THRESHOLD_INDEX_MIN_USERS = 100
+
 # Default error rate threshold (percentage)
 DEFAULT_ERROR_RATE = 5.0
 
-# Default alert frequency in minutes
+# Sliding window for the error rate in minutes, and its bucket width in seconds
+ERROR_RATE_WINDOW = 60
+ERROR_RATE_BUCKET = 60
+
+# Minimum number of rows in the window before error rate alerts are sent
+ERROR_RATE_MIN_ROWS = 10
+
+# Default alert frequency in minutes: how often ongoing episodes are summarized
 DEFAULT_ALERT_FREQUENCY = 60
 
+# Hysteresis margins: an out-of-range episode only ends once a reading is back
+# inside the range narrowed by this amount on both sides
+ALERT_HYSTERESIS = {
+    'temperature': 0.5,
+    'humidity': 0.02,
+    'light': 50
+}
+
+# Anomaly detection, enabled per user with /setanomaly: weight of each new reading
+# in the exponentially weighted mean and variance (between 0 and 1), and readings
+# needed before jumps away from the mean are reported
+ANOMALY_ALPHA = 0.05
+ANOMALY_WARMUP = 30
+
+# Default z-score limit and minutes without any change before a sensor is reported as stuck
+ANOMALY_ZSCORE = 4.0
+ANOMALY_STUCK_MINUTES = 30
+
+# Smallest standard deviation z-scores are computed with, so small changes of a very
+# steady signal are not reported as jumps
+ANOMALY_MIN_STD = {
+    'temperature': 0.1,
+    'humidity': 0.005,
+    'light': 5
+}
+
+# Largest plausible change per minute
+ANOMALY_MAX_RATE = {
+    'temperature': 2,
+    'humidity': 0.1,
+    'light': 1000
+}
+
+# Alert outbox: sender tasks, queued message limit and retries per message
+ALERT_SENDER_TASKS = 4
+ALERT_OUTBOX_SIZE = 1000
+ALERT_SEND_RETRIES = 5
+
+# Telegram send limits in messages per second
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+
 # Data directory
 DATA_DIR = 'data'
 
+# Columnar history of all readings, one store per sensor
+HISTORY_DIR = os.path.join(DATA_DIR, 'history')
+
+# Readings kept in memory for /history and /chart (one month of minute data)
+RECENT_WINDOW_ROWS = 31 * 24 * 60
+
+# Buckets in /history text replies and points in /chart images
+HISTORY_TEXT_BUCKETS = 24
+CHART_POINTS = 500
+
+# Minutes of recent readings a new /setrange range is checked against, and the
+# maximum number of sensors listed in the reply
+RANGE_CHECK_WINDOW = 60
+RANGE_CHECK_MAX_SENSORS = 10
+
+# Number of rendered /history and /chart results kept in memory
+CHART_CACHE_SIZE = 64
+
+# SQLite file holding sessions, thresholds and alert settings across restarts
+STATE_DB = os.path.join(DATA_DIR, 'state.sqlite3')
+
+# Seconds between background writes of changed state
+STATE_FLUSH_INTERVAL = 2.0
+
+# Watch subdirectories of DATA_DIR too (one subdirectory per sensor)
+RECURSIVE_WATCH = os.getenv('RECURSIVE_WATCH', 'false').lower() in ('1', 'true', 'yes')
+
+# Reads of at least this many bytes are parsed in the process pool
+PARSE_IN_POOL_BYTES = 1024 * 1024
+
+# Upper bound on the bytes parsed in one batch, and number of parser processes
+MAX_READ_BYTES = 64 * 1024 * 1024
+PARSE_WORKERS = 2
+
+# Rotation of the live CSV files: a file is moved to a timestamped segment once it
+# reaches ROTATE_MAX_BYTES or has been written for ROTATE_INTERVAL hours (0 disables either)
+ROTATE_MAX_BYTES = 64 * 1024 * 1024
+ROTATE_INTERVAL = 24
+
+# Seconds a rotated segment must go without new data before it is compressed
+ROTATE_GRACE = 60
+
+# Grace periods after which a rotated segment that still grows is reported, since its
+# writer keeps the old file open instead of reopening the live path
+SEGMENT_GROWING_WARNING = 10
+
+# Days compressed segments are kept before they are deleted
+SEGMENT_RETENTION_DAYS = int(os.getenv('SEGMENT_RETENTION_DAYS', '30'))
+
+# Seconds between rotation and retention checks
+RETENTION_CHECK_INTERVAL = 30
+
+# Seconds to collect file events for the same path into one processing pass
+EVENT_COALESCE_WINDOW = 1.0
+
+# Local HTTP endpoint serving metrics in the Prometheus text format (port 0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
 # Whitelisted usernames (comma-separated)
 WHITELISTED_USERS = os.getenv('WHITELISTED_USERS', '').split(',')
 
@@ -32,5 +158,11 @@ LOGIN_CODE = os.getenv('TEMP_CODE', '')
 # Login expiration time in minutes
 LOGIN_EXPIRATION = 10
 
+# Minutes before a session expires to warn the user (0 disables the warning)
+SESSION_EXPIRY_WARNING = int(os.getenv('SESSION_EXPIRY_WARNING', '0'))
+
 # Maximum number of login attempts
-MAX_LOGIN_ATTEMPTS = 3 
\ No newline at end of file
+MAX_LOGIN_ATTEMPTS = 3
+
+# Minutes a user has to wait after using up their login attempts
+LOGIN_LOCKOUT = 15 
\ No newline at end of file
@@ -0,0 +1,178 @@
+import io
+import os
+import csv
+import asyncio
+import logging
+import pandas as pd
+from thresholds import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes before the offset we compare to notice a file rewritten in place
+FINGERPRINT_SIZE = 64
+
+
+def parse_lines(data, header):
+    """Parse complete CSV lines; the first line is the header when none is known yet."""
+    if header is None:
+        header_end = data.index(b'\n')
+        header_line = data[:header_end].decode('utf-8-sig').strip()
+        header = next(csv.reader([header_line]))
+        data = data[header_end + 1:]
+    if not data.strip():
+        return header, pd.DataFrame(columns=header)
+    df = pd.read_csv(io.BytesIO(data), header=None, names=header, on_bad_lines='warn')
+    # Unreadable readings such as a logger's error text count as missing
+    for _, column, _ in METRICS:
+        if column in df and not pd.api.types.is_numeric_dtype(df[column]):
+            values = pd.to_numeric(df[column], errors='coerce')
+            unreadable = int((values.isna() & df[column].notna()).sum())
+            if unreadable:
+                logger.warning(f"{unreadable} unreadable {column} values treated as missing")
+            df[column] = values
+    return header, df
+
+
+def line_boundary(file_path, size):
+    """Offset just past the last complete line within the first size bytes of a file."""
+    try:
+        with open(file_path, 'rb') as f:
+            position = size
+            while position > 0:
+                start = max(0, position - 64 * 1024)
+                f.seek(start)
+                end = f.read(position - start).rfind(b'\n')
+                if end != -1:
+                    return start + end + 1
+                position = start
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+def read_range(file_path, inode, offset, length, header):
+    """Read and parse the complete lines in a byte range of a file.
+
+    Runs in a worker process for large reads. Returns None if the file is no
+    longer the one the reader was following, otherwise the number of bytes
+    consumed, the header, the tail of the consumed bytes and the parsed rows.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_ino != inode:
+            return None
+        f.seek(offset)
+        chunk = f.read(length)
+
+    # Hold back a partial last line until the writer finishes it
+    end = chunk.rfind(b'\n')
+    if end == -1:
+        return 0, header, b'', None
+    complete = chunk[:end + 1]
+    header, df = parse_lines(complete, header)
+    return len(complete), header, complete[-FINGERPRINT_SIZE:], df
+
+
+class CSVTailReader:
+    """Reads only the complete lines appended to a CSV file since the last call."""
+
+    def __init__(self, file_path):
+        self.file_path = str(file_path)
+        # Times the file was found replaced, truncated or rewritten
+        self.resets = 0
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.header = None
+        self.inode = None
+        self.device = None
+        self.size = 0
+        self.fingerprint = b''
+
+    def checkpoint(self):
+        return {
+            'offset': self.offset,
+            'inode': self.inode,
+            'device': self.device,
+            'size': self.size,
+            'fingerprint': self.fingerprint.hex(),
+            'header': self.header,
+        }
+
+    def restore(self, checkpoint):
+        """Resume from a checkpoint if the file is still the one it was taken from."""
+        if checkpoint.get('inode') is None:
+            return False
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_dev) != (checkpoint['inode'], checkpoint['device']) or stat.st_size < checkpoint['size']:
+            logger.info(f"File {self.file_path} changed since its checkpoint, reading from the start")
+            return False
+        self.offset = checkpoint['offset']
+        self.inode = checkpoint['inode']
+        self.device = checkpoint['device']
+        self.size = checkpoint['size']
+        self.fingerprint = bytes.fromhex(checkpoint['fingerprint'])
+        self.header = checkpoint['header']
+        return True
+
+    def pending_bytes(self):
+        """Check the file's identity and return how many unread bytes it has."""
+        try:
+            f = open(self.file_path, 'rb')
+        except FileNotFoundError:
+            logger.info(f"File {self.file_path} no longer exists")
+            return 0
+
+        with f:
+            stat = os.fstat(f.fileno())
+            if self.inode is not None and (stat.st_ino, stat.st_dev) != (self.inode, self.device):
+                logger.info(f"File {self.file_path} was replaced, reading from the start")
+                self.reset()
+                self.resets += 1
+            elif stat.st_size < self.offset:
+                logger.info(f"File {self.file_path} was truncated, reading from the start")
+                self.reset()
+                self.resets += 1
+            elif self.fingerprint and not self._fingerprint_matches(f):
+                logger.info(f"File {self.file_path} was rewritten, reading from the start")
+                self.reset()
+                self.resets += 1
+            self.inode, self.device, self.size = stat.st_ino, stat.st_dev, stat.st_size
+            return stat.st_size - self.offset
+
+    def _apply(self, result):
+        if result is None:
+            # Replaced between the identity check and the read; picked up next time
+            return None
+        consumed, header, tail, df = result
+        if not consumed:
+            return None
+        self.offset += consumed
+        self.header = header
+        self.fingerprint = (self.fingerprint + tail)[-FINGERPRINT_SIZE:]
+        return df
+
+    async def read_chunk(self, executor=None, pool_threshold=0, max_bytes=None):
+        """Read the next batch of new rows, or None when there are no complete new lines.
+
+        Reads of at least pool_threshold bytes are parsed on the executor so large
+        backlogs do not block the event loop; max_bytes bounds a single batch.
+        """
+        pending = self.pending_bytes()
+        if not pending:
+            return None
+        length = min(pending, max_bytes) if max_bytes else pending
+        args = (self.file_path, self.inode, self.offset, length, self.header)
+        if executor is not None and length >= pool_threshold:
+            logger.info(f"Parsing {length} bytes of {self.file_path} in a worker process")
+            result = await asyncio.get_running_loop().run_in_executor(executor, read_range, *args)
+        else:
+            result = read_range(*args)
+        return self._apply(result)
+
+    def _fingerprint_matches(self, f):
+        f.seek(self.offset - len(self.fingerprint))
+        return f.read(len(self.fingerprint)) == self.fingerprint
@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def try_acquire(self):
+        """Take a token if one is available, otherwise return the seconds until one is."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class AlertDispatcher:
+    """Sends queued messages from a pool of sender tasks.
+
+    Messages are kept in a FIFO per chat and only one message per chat is in flight,
+    so per-chat order is preserved. Chats take turns on a shared ready queue, a chat
+    that has used up its rate limit is re-queued once it has a token again, and all
+    sends share one global token bucket.
+    """
+
+    def __init__(self, bot, workers=4, max_pending=1000, global_rate=30, global_burst=None,
+                 chat_rate=1, chat_burst=3, max_retries=5, backoff=1.0):
+        self.bot = bot
+        self.workers = workers
+        self.max_pending = max_pending
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pending = {}
+        self.pending_count = 0
+        self.ready = None
+        self.tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def start(self):
+        self.ready = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Alert dispatcher started with {self.workers} sender tasks")
+
+    async def stop(self, timeout=10):
+        if self.pending_count:
+            logger.info(f"Waiting for {self.pending_count} queued messages to be sent")
+            deadline = time.monotonic() + timeout
+            while self.pending_count and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info(f"Alert dispatcher stopped, {self.pending_count} messages left unsent")
+
+    def submit(self, chat_id, text):
+        """Queue a message without waiting; returns False if the outbox is full."""
+        if self.pending_count >= self.max_pending:
+            self.dropped += 1
+            metrics.ALERTS_DROPPED.inc()
+            logger.warning(f"Outbox full, dropping message for chat {chat_id}")
+            return False
+        self.pending_count += 1
+        message = (text, time.monotonic())
+        if chat_id in self.pending:
+            self.pending[chat_id].append(message)
+        else:
+            self.pending[chat_id] = deque([message])
+            self.ready.put_nowait(chat_id)
+        return True
+
+    def stats(self):
+        return {
+            'pending': self.pending_count,
+            'chats': len(self.pending),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'dropped': self.dropped,
+        }
+
+    def _chat_bucket(self, chat_id):
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return self.chat_buckets[chat_id]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self.ready.get()
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait:
+                # Let other chats go first instead of blocking this sender
+                loop.call_later(wait, self.ready.put_nowait, chat_id)
+                continue
+
+            await self.global_bucket.acquire()
+            messages = self.pending[chat_id]
+            text, queued_at = messages[0]
+            if await self._send(chat_id, text):
+                metrics.SEND_LATENCY_SECONDS.observe(time.monotonic() - queued_at)
+            messages.popleft()
+            self.pending_count -= 1
+            if messages:
+                self.ready.put_nowait(chat_id)
+            else:
+                del self.pending[chat_id]
+
+    async def _send(self, chat_id, text):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                logger.warning(f"Rate limited by Telegram, retrying chat {chat_id} in {retry_after}s")
+                delay = retry_after
+            except (BadRequest, Forbidden) as e:
+                # Permanent errors (unknown chat, blocked bot, invalid message); BadRequest is a NetworkError too
+                logger.error(f"Failed to send message to chat {chat_id}: {e}")
+                self.failed += 1
+                metrics.SEND_FAILURES.inc()
+                return False
+            except NetworkError as e:
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Network error sending to chat {chat_id}: {e}, retrying in {delay}s")
+            except TelegramError as e:
+                logger.error(f"Failed to send message to chat {chat_id}: {e}")
+                self.failed += 1
+                metrics.SEND_FAILURES.inc()
+                return False
+            except Exception as e:
+                logger.error(f"Unexpected error sending to chat {chat_id}: {e}", exc_info=True)
+                self.failed += 1
+                metrics.SEND_FAILURES.inc()
+                return False
+            if attempt < self.max_retries:
+                self.retried += 1
+                metrics.SEND_RETRIES.inc()
+                await asyncio.sleep(delay)
+        logger.error(f"Giving up on message to chat {chat_id} after {self.max_retries} retries")
+        self.failed += 1
+        metrics.SEND_FAILURES.inc()
+        return False
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def minmax_buckets(times, values, buckets):
+    """Reduce readings to at most `buckets` equal-count buckets.
+
+    Returns the first timestamp, min, mean and max of every bucket; missing
+    readings are ignored and buckets without any reading hold NaN.
+    """
+    count = len(times)
+    if not count:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty
+    edges = np.unique(np.linspace(0, count, min(buckets, count) + 1).astype(np.int64))[:-1]
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mins = np.fmin.reduceat(values, edges)
+        maxs = np.fmax.reduceat(values, edges)
+        means = np.add.reduceat(np.where(valid, values, 0.0), edges) / np.add.reduceat(valid, edges)
+    return np.asarray(times)[edges], mins, means, maxs
@@ -0,0 +1,174 @@
+import logging
+import numpy as np
+import pandas as pd
+from charts import format_time
+from history import MISSING_TIME
+from thresholds import METRICS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ('count', 'min', 'max', 'first', 'last')
+
+
+def summarize(times, values, outside, start, end):
+    """Count, extremes and first/last time of the out-of-range readings in rows [start, end)."""
+    rows = np.flatnonzero(outside[start:end]) + start
+    if not len(rows):
+        return None
+    readings = values[rows]
+    return {
+        'count': len(rows),
+        'min': float(readings.min()),
+        'max': float(readings.max()),
+        'first': int(times[rows[0]]),
+        'last': int(times[rows[-1]]),
+    }
+
+
+def merge(a, b):
+    if a is None or b is None:
+        return a or b
+    return {
+        'count': a['count'] + b['count'],
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max']),
+        'first': min(a['first'], b['first']),
+        'last': max(a['last'], b['last']),
+    }
+
+
+def scan(times, values, low, high, margin, was_open):
+    """Run the excursion state machine over one metric's readings.
+
+    An episode opens when a reading leaves [low, high] and closes once a reading is
+    back inside the range narrowed by margin; readings in between and missing
+    readings keep the current state. Returns the episodes touched by these rows as
+    (summary, closed_at) pairs, and whether the last one is still open.
+    """
+    count = len(values)
+    outside = (values < low) | (values > high)
+    if not was_open and not outside.any():
+        return [], False
+    margin = min(margin, (high - low) / 2)
+    inside = (values >= low + margin) & (values <= high - margin)
+    positions = np.where(outside | inside, np.arange(count), -1)
+    last_decided = np.maximum.accumulate(positions)
+    state = np.where(last_decided >= 0, outside[np.maximum(last_decided, 0)], was_open)
+    previous = np.concatenate(([was_open], state[:-1]))
+
+    starts = np.flatnonzero(state & ~previous).tolist()
+    ends = np.flatnonzero(~state & previous).tolist()
+    if was_open:
+        starts.insert(0, 0)
+    if state[-1]:
+        ends.append(count)
+    episodes = [(summarize(times, values, outside, start, end), int(times[end]) if end < count else None)
+                for start, end in zip(starts, ends)]
+    return episodes, bool(state[-1])
+
+
+class EpisodeTracker:
+    """Tracks out-of-range episodes per user, sensor and metric.
+
+    Open episodes live in the caller's per-user state as {metric: summary}. Users
+    with the same range and episode state share one scan of the new rows.
+    """
+
+    def __init__(self, margins):
+        self.margins = margins
+
+    def update(self, df, times, thresholds_by_user, episodes_by_user):
+        """Advance the episodes of the given users over new rows with the given epoch seconds.
+
+        Returns {user_id: {metric: change}} for every metric with episodes in these rows.
+        """
+        valid = times != MISSING_TIME
+        if not valid.any():
+            return {}
+        times = times[valid]
+        values = {key: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)[valid]
+                  for key, column, _ in METRICS}
+
+        scans = {}
+        results = {}
+        changes = {}
+        for user_id, thresholds in thresholds_by_user.items():
+            episodes = episodes_by_user[user_id]
+            for key, _, _ in METRICS:
+                low, high = float(thresholds[key]['min']), float(thresholds[key]['max'])
+                episode = episodes.get(key)
+                scan_key = (key, low, high, episode is not None)
+                if scan_key not in scans:
+                    scans[scan_key] = scan(times, values[key], low, high, self.margins.get(key, 0), episode is not None)
+                touched, still_open = scans[scan_key]
+                if not touched:
+                    continue
+
+                # Users with the same range and the same open episode get the same result
+                stored = tuple(episode[field] for field in SUMMARY_FIELDS) if episode is not None else None
+                result_key = (scan_key, stored)
+                if result_key not in results:
+                    results[result_key] = self._advance(touched, still_open, stored)
+                change, current = results[result_key]
+                if current is not None:
+                    notified = episode.get('notified') if episode is not None and len(touched) == 1 else None
+                    episodes[key] = dict(current, notified=notified)
+                else:
+                    episodes.pop(key, None)
+                changes.setdefault(user_id, {})[key] = change
+        return changes
+
+    def _advance(self, touched, still_open, stored):
+        summaries = [summary for summary, _ in touched]
+        opened = len(touched)
+        if stored is not None:
+            summaries[0] = merge(dict(zip(SUMMARY_FIELDS, stored)), summaries[0])
+            opened -= 1
+        closed = [closed_at for _, closed_at in touched if closed_at is not None]
+        total = None
+        for summary in summaries:
+            total = merge(total, summary)
+        change = {
+            'episodes': len(touched),
+            'opened': opened,
+            'closed_at': closed[-1] if closed else None,
+            'open': still_open,
+            'summary': total,
+        }
+        return change, summaries[-1] if still_open else None
+
+
+def format_episode(label, change, low, high):
+    """One fixed-size line describing the episodes of a metric."""
+    summary = change['summary']
+    if change['open'] and not change['opened'] and not change['closed_at']:
+        status = f"⏳ {label} still out of range since {format_time(summary['first'])}"
+    elif change['open']:
+        status = f"🔴 {label} out of range since {format_time(summary['first'])}"
+    else:
+        status = f"🟢 {label} back in range at {format_time(change['closed_at'])}"
+    if change['episodes'] > 1:
+        status += f" ({change['episodes']} episodes)"
+    return (
+        f"{status}: {summary['count']} readings outside {low:g}-{high:g}, "
+        f"min {summary['min']:g}, max {summary['max']:g}, last at {format_time(summary['last'])}"
+    )
+
+
+def check_window(readings, thresholds):
+    """Summaries of the out-of-range readings per metric in a window of recent readings."""
+    results = {}
+    for key, _, _ in METRICS:
+        values = readings[key].astype(float)
+        outside = (values < thresholds[key]['min']) | (values > thresholds[key]['max'])
+        summary = summarize(readings['time'], values, outside, 0, len(values))
+        if summary is not None:
+            results[key] = summary
+    return results
+
+
+def format_window_check(label, summary, total, low, high):
+    return (
+        f"⚠️ {label}: {summary['count']} of {total} readings outside {low:g}-{high:g}, "
+        f"min {summary['min']:g}, max {summary['max']:g}, last at {format_time(summary['last'])}"
+    )
@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+from history import MISSING_TIME
+
+logger = logging.getLogger(__name__)
+
+SENSOR_COLUMNS = ['Temperature', 'Humidity', 'Light']
+
+
+class ErrorRateMonitor:
+    """Percentage of rows with missing readings over a sliding time window.
+
+    Rows are counted into a ring of fixed-width time buckets with running totals,
+    so adding rows and reading the rate never rescan old data.
+    """
+
+    def __init__(self, window=3600, bucket=60):
+        self.window = window
+        self.bucket = bucket
+        self.size = max(1, -(-window // bucket))
+        self.totals = np.zeros(self.size, dtype=np.int64)
+        self.missing = np.zeros(self.size, dtype=np.int64)
+        self.total_count = 0
+        self.missing_count = 0
+        self.head = -1
+        self.last_timestamp = None
+
+    def add_rows(self, df, seconds):
+        """Count new rows, given their epoch seconds (MISSING_TIME where unreadable)."""
+        valid = seconds != MISSING_TIME
+        if not valid.all():
+            # Rows with an unreadable time are counted at the latest known time
+            fallback = seconds[valid].max() if valid.any() else self.last_timestamp
+            if fallback is None:
+                return
+            seconds = np.where(valid, seconds, fallback)
+        missing = df.reindex(columns=SENSOR_COLUMNS).isna().any(axis=1).to_numpy()
+        self.add(seconds, missing)
+
+    def add(self, timestamps, missing):
+        if len(timestamps) == 0:
+            return
+        bucket_ids, inverse = np.unique(np.asarray(timestamps) // self.bucket, return_inverse=True)
+        totals = np.bincount(inverse, minlength=len(bucket_ids))
+        missing = np.bincount(inverse, weights=np.asarray(missing, dtype=np.int64), minlength=len(bucket_ids))
+        for bucket_id, total, miss in zip(bucket_ids.tolist(), totals.tolist(), missing.astype(np.int64).tolist()):
+            self._add_bucket(bucket_id, total, miss)
+        latest = int(np.max(timestamps))
+        self.last_timestamp = latest if self.last_timestamp is None else max(self.last_timestamp, latest)
+
+    def _add_bucket(self, bucket_id, total, missing):
+        if bucket_id > self.head:
+            self._advance(bucket_id)
+        elif bucket_id <= self.head - self.size:
+            return
+        slot = bucket_id % self.size
+        self.totals[slot] += total
+        self.missing[slot] += missing
+        self.total_count += total
+        self.missing_count += missing
+
+    def _advance(self, bucket_id):
+        # Expire the buckets that fall out of the window, at most one full ring
+        for expired in range(max(self.head + 1, bucket_id - self.size + 1), bucket_id + 1):
+            slot = expired % self.size
+            self.total_count -= int(self.totals[slot])
+            self.missing_count -= int(self.missing[slot])
+            self.totals[slot] = 0
+            self.missing[slot] = 0
+        self.head = bucket_id
+
+    def rate(self):
+        if not self.total_count:
+            return 0.0
+        return 100.0 * self.missing_count / self.total_count
+
+    def stats(self):
+        return {
+            'rows': self.total_count,
+            'missing': self.missing_count,
+            'rate': self.rate(),
+        }
@@ -0,0 +1,45 @@
+import time
+import random
+import asyncio
+import logging
+from telegram.error import NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class FakeBot:
+    """Offline stand-in for telegram.Bot that records sent messages.
+
+    Simulates request latency and, optionally, Telegram's flood control and
+    network failures so the alert pipeline can be exercised without a network.
+    """
+
+    def __init__(self, latency=0.05, global_limit=None, chat_limit=None, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.sent = []
+        self.rejected = 0
+        self.recent = []
+        self.recent_by_chat = {}
+
+    def _over_limit(self, timestamps, limit, now):
+        while timestamps and now - timestamps[0] >= 1:
+            timestamps.pop(0)
+        return limit is not None and len(timestamps) >= limit
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        chat_recent = self.recent_by_chat.setdefault(chat_id, [])
+        if self._over_limit(self.recent, self.global_limit, now) or self._over_limit(chat_recent, self.chat_limit, now):
+            self.rejected += 1
+            raise RetryAfter(1)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise NetworkError("Simulated network failure")
+        self.recent.append(now)
+        chat_recent.append(now)
+        self.sent.append((now, chat_id, text))
+        return None
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class FileEventBridge:
+    """Hands file paths from the watchdog observer thread to the asyncio event loop.
+
+    Events for a path that is already waiting in the queue are coalesced, and the
+    consumer collects further events for a configurable window before processing,
+    so a burst of writes to one file results in a single processing pass.
+    """
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.loop = None
+        self.queue = None
+        self.queued_paths = set()
+        self.received = 0
+        self.coalesced = 0
+        self.processed = 0
+
+    def bind(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def submit(self, path):
+        # Called from the observer thread
+        if self.loop is None or self.loop.is_closed():
+            logger.warning(f"Event loop not running, dropping file event for {path}")
+            return
+        self.loop.call_soon_threadsafe(self._enqueue, path)
+
+    def _enqueue(self, path):
+        self.received += 1
+        metrics.FILE_EVENTS_RECEIVED.inc()
+        if path in self.queued_paths:
+            self.coalesced += 1
+            metrics.FILE_EVENTS_COALESCED.inc()
+            return
+        self.queued_paths.add(path)
+        self.queue.put_nowait(path)
+
+    async def _get(self):
+        path = await self.queue.get()
+        self.queued_paths.discard(path)
+        return path
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize() if self.queue else 0,
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'processed': self.processed,
+        }
+
+    async def run(self, callback):
+        while True:
+            pending = {await self._get(): None}
+            deadline = self.loop.time() + self.window
+            while True:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    path = await asyncio.wait_for(self._get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if path in pending:
+                    self.coalesced += 1
+                    metrics.FILE_EVENTS_COALESCED.inc()
+                else:
+                    pending[path] = None
+
+            for path in pending:
+                self.processed += 1
+                try:
+                    await callback(path)
+                except Exception as e:
+                    logger.error(f"Error handling file event for {path}: {e}", exc_info=True)
+            logger.debug(f"File event bridge stats: {self.stats()}")
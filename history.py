@@ -0,0 +1,277 @@
+import os
+import json
+import logging
+import argparse
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+'''
+Append-only columnar history of sensor readings. Each segment stores a fixed
+number of rows as memory-mapped typed columns, and a small JSON index keeps the
+time range and a sparse sample of timestamps for every segment.
+Example usage (backfill from existing CSV files):
+python history.py data/history/data data/data.csv
+'''
+
+# (column file suffix, CSV column, dtype)
+COLUMNS = [
+    ('time', 'Time', np.int64),
+    ('temperature', 'Temperature', np.float32),
+    ('humidity', 'Humidity', np.float32),
+    ('light', 'Light', np.float32),
+]
+
+# Epoch seconds of a row whose time could not be read
+MISSING_TIME = np.iinfo(np.int64).min
+
+# Rows per segment file (about 45 days of minute data)
+SEGMENT_ROWS = 1 << 16
+
+# Every n-th timestamp of a segment is kept in the in-memory sparse index
+INDEX_STRIDE = 1024
+
+# Number of read-only segment mappings kept open
+OPEN_SEGMENTS = 4
+
+
+def to_epoch_seconds(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[s]').astype(np.int64))
+
+
+def parse_times(values):
+    """Epoch seconds of a column of timestamps, MISSING_TIME where a time cannot be read."""
+    return pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def frame_to_columns(df, times=None):
+    """Typed columns of the rows with a readable time; times are the rows' epoch seconds if parsed already."""
+    if times is None:
+        times = parse_times(df['Time'])
+    valid = times != MISSING_TIME
+    columns = {'time': times[valid]}
+    for name, column, dtype in COLUMNS[1:]:
+        columns[name] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=dtype)[valid]
+    return columns
+
+
+def in_order(times, last_timestamp):
+    """Mask of the rows that keep a time column sorted when appended after last_timestamp.
+
+    Rows with the same time as the one before them are kept, also across batches.
+    Late rows, such as those after a clock was set back, are dropped.
+    """
+    if not len(times):
+        return np.empty(0, dtype=bool)
+    keep = times >= np.maximum.accumulate(times)
+    if last_timestamp is not None:
+        keep &= times >= last_timestamp
+    return keep
+
+
+class Segment:
+    def __init__(self, directory, number, rows=0, start=None, end=None, sparse=None):
+        self.directory = directory
+        self.number = number
+        self.rows = rows
+        self.start = start
+        self.end = end
+        self.sparse = np.array(sparse or [], dtype=np.int64)
+
+    def path(self, name):
+        return self.directory / f"{self.number:06d}.{name}"
+
+    def open(self, mode):
+        if mode == 'w+' and not self.path('time').exists():
+            return {name: np.memmap(self.path(name), dtype=dtype, mode='w+', shape=(SEGMENT_ROWS,))
+                    for name, _, dtype in COLUMNS}
+        return {name: np.memmap(self.path(name), dtype=dtype, mode='r' if mode == 'r' else 'r+', shape=(SEGMENT_ROWS,))
+                for name, _, dtype in COLUMNS}
+
+    def to_dict(self):
+        return {
+            'number': self.number,
+            'rows': self.rows,
+            'start': self.start,
+            'end': self.end,
+            'sparse': self.sparse.tolist(),
+        }
+
+
+class HistoryStore:
+    """Columnar history with binary-search range queries.
+
+    Only the segment being written and a few recently read segments are mapped,
+    so memory use does not grow with the length of the history.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segments = []
+        self.tail = None
+        self.readers = OrderedDict()
+        self.skipped = 0
+        self._load_index()
+
+    @property
+    def index_path(self):
+        return self.directory / 'index.json'
+
+    @property
+    def last_timestamp(self):
+        return self.segments[-1].end if self.segments else None
+
+    def __len__(self):
+        return sum(segment.rows for segment in self.segments)
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path) as f:
+            index = json.load(f)
+        self.segments = [Segment(self.directory, **entry) for entry in index['segments']]
+        logger.info(f"Loaded history index {self.directory} with {len(self)} rows in {len(self.segments)} segments")
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'segments': [segment.to_dict() for segment in self.segments]}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def append_frame(self, df):
+        return self.append(frame_to_columns(df))
+
+    def append(self, columns):
+        times = columns['time']
+        if not len(times):
+            return 0
+        # Keep the time column sorted, the recent window and the anomaly statistics drop the same rows
+        keep = in_order(times, self.last_timestamp)
+        if not keep.all():
+            self.skipped += int((~keep).sum())
+            logger.info(f"Dropping {int((~keep).sum())} rows older than the latest stored reading from {self.directory}")
+            columns = {name: values[keep] for name, values in columns.items()}
+            times = columns['time']
+
+        written = 0
+        while written < len(times):
+            segment = self.segments[-1] if self.segments and self.segments[-1].rows < SEGMENT_ROWS else None
+            if segment is None:
+                segment = Segment(self.directory, self.segments[-1].number + 1 if self.segments else 0)
+                self.segments.append(segment)
+                self._close_tail()
+            if self.tail is None:
+                self.tail = segment.open('w+')
+            count = min(SEGMENT_ROWS - segment.rows, len(times) - written)
+            for name, _, _ in COLUMNS:
+                self.tail[name][segment.rows:segment.rows + count] = columns[name][written:written + count]
+            first_stride = -(-segment.rows // INDEX_STRIDE) * INDEX_STRIDE
+            new_sparse = self.tail['time'][first_stride:segment.rows + count:INDEX_STRIDE]
+            segment.sparse = np.concatenate((segment.sparse, new_sparse))
+            if segment.start is None:
+                segment.start = int(times[written])
+            segment.end = int(times[written + count - 1])
+            segment.rows += count
+            written += count
+            self.readers.pop(segment.number, None)
+
+        if written:
+            self._save_index()
+        return written
+
+    def _close_tail(self):
+        if self.tail is not None:
+            for column in self.tail.values():
+                column.flush()
+            self.tail = None
+
+    def _columns(self, segment):
+        if segment is self.segments[-1] and self.tail is not None:
+            return self.tail
+        if segment.number in self.readers:
+            self.readers.move_to_end(segment.number)
+        else:
+            self.readers[segment.number] = segment.open('r')
+            while len(self.readers) > OPEN_SEGMENTS:
+                self.readers.popitem(last=False)
+        return self.readers[segment.number]
+
+    def _locate(self, segment, times, timestamp, side):
+        # Narrow the search to one stride with the sparse index, then search the mapped column
+        block = np.searchsorted(segment.sparse, timestamp, side=side)
+        low = max(0, (block - 1) * INDEX_STRIDE)
+        high = min(segment.rows, block * INDEX_STRIDE + 1)
+        return low + int(np.searchsorted(times[low:high], timestamp, side=side))
+
+    def iter_range(self, start, end):
+        """Yield zero-copy column slices, one per segment, for start <= time <= end."""
+        start = to_epoch_seconds(start)
+        end = to_epoch_seconds(end)
+        ends = [segment.end for segment in self.segments]
+        first = int(np.searchsorted(ends, start, side='left'))
+        for segment in self.segments[first:]:
+            if segment.start > end:
+                break
+            columns = self._columns(segment)
+            times = columns['time']
+            low = self._locate(segment, times, start, 'left')
+            high = self._locate(segment, times, end, 'right')
+            if high > low:
+                yield {name: values[low:high] for name, values in columns.items()}
+
+    def query(self, start, end):
+        parts = list(self.iter_range(start, end))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, _, dtype in COLUMNS}
+        return {name: np.concatenate([part[name] for part in parts]) for name, _, _ in COLUMNS}
+
+    def latest(self, count):
+        """The last `count` rows, oldest first."""
+        parts = []
+        remaining = count
+        for segment in reversed(self.segments):
+            if remaining <= 0:
+                break
+            columns = self._columns(segment)
+            take = min(remaining, segment.rows)
+            parts.append({name: values[segment.rows - take:segment.rows] for name, values in columns.items()})
+            remaining -= take
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, _, dtype in COLUMNS}
+        return {name: np.concatenate([part[name] for part in reversed(parts)]) for name, _, _ in COLUMNS}
+
+    def backfill(self, csv_path, chunksize=100_000):
+        total = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            total += self.append_frame(chunk)
+        logger.info(f"Backfilled {total} rows from {csv_path} into {self.directory}")
+        return total
+
+    def close(self):
+        self._close_tail()
+        self.readers.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill a history store from sensor CSV files.')
+    parser.add_argument('directory', type=str, help='History store directory')
+    parser.add_argument('csv_files', type=str, nargs='+', help='CSV files to import, oldest first')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    store = HistoryStore(args.directory)
+    for csv_file in args.csv_files:
+        store.backfill(csv_file)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+registry = []
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+        registry.append(self)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def expose(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter",
+                f"{self.name} {format_value(self.value)}"]
+
+
+class Gauge:
+    """A value that is set directly or read from a function when exposed."""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.function = None
+        registry.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def expose(self):
+        value = self.function() if self.function else self.value
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge",
+                f"{self.name} {format_value(value)}"]
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        registry.append(self)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+def expose():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+async def handle_request(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', expose().encode()
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'Not found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_server(host, port):
+    """Serve GET /metrics on the running event loop."""
+    server = await asyncio.start_server(handle_request, host, port)
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
+
+
+FILE_EVENTS_RECEIVED = Counter('sensor_bot_file_events_received_total', 'File events received from the watcher')
+FILE_EVENTS_COALESCED = Counter('sensor_bot_file_events_coalesced_total', 'File events merged into a pending processing pass')
+FILE_EVENTS_QUEUED = Gauge('sensor_bot_file_events_queued', 'Paths waiting to be processed')
+ROWS_PARSED = Counter('sensor_bot_rows_parsed_total', 'CSV rows parsed')
+PARSE_SECONDS = Histogram('sensor_bot_parse_seconds', 'Time to read and parse one batch of new rows')
+EVALUATION_SECONDS = Histogram('sensor_bot_evaluation_seconds', 'Time to evaluate one batch of rows for all subscribers')
+ALERTS_PRODUCED = Counter('sensor_bot_alerts_produced_total', 'Alert messages queued for sending')
+ALERTS_SUPPRESSED = Counter('sensor_bot_alerts_suppressed_total', 'Alert messages held back by the alert frequency')
+ALERTS_DROPPED = Counter('sensor_bot_alerts_dropped_total', 'Alert messages dropped because the outbox was full')
+ALERTS_PENDING = Gauge('sensor_bot_alerts_pending', 'Alert messages waiting in the outbox')
+SEND_LATENCY_SECONDS = Histogram('sensor_bot_send_latency_seconds', 'Time from queueing a message to Telegram accepting it')
+SEND_RETRIES = Counter('sensor_bot_send_retries_total', 'Message send attempts that were retried')
+SEND_FAILURES = Counter('sensor_bot_send_failures_total', 'Messages that could not be sent')
@@ -1,50 +1,176 @@
-import csv
+import os
+import time
 import random
 import argparse
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
 
 '''
 This script generates fake sensor data. Define sensor values by ranges and time periods with array of dicts.
 Example usage:
 python sensor_data_simulator.py '[{"time":30,"temperature":[19,21],"humidity":[0.8,0.8],"light":[2000,2010],"error":0.1},{"time":60,"temperature":[30,35],"humidity":[0.8,0.8],"light":[2000,2010],"error":0}]' --output data.csv
+
+Generate several sensors at once, reproducibly (writes data-00.csv ... data-23.csv):
+python sensor_data_simulator.py periods.json --output data.csv --sensors 24 --seed 42 --start "2025-01-01 00:00:00"
+
+Imitate live loggers by appending rows, here 10 rows per second per file with some partial-line flushes:
+python sensor_data_simulator.py periods.json --output ../data/data.csv --live --rate 10 --partial 0.2
 '''
 
+HEADER = ['Time', 'Temperature', 'Humidity', 'Light']
+
+# Rows generated per batch when writing files
+CHUNK_ROWS = 1_000_000
+
+
+def sensor_paths(output_file, sensors):
+    if sensors == 1:
+        return [Path(output_file)]
+    output = Path(output_file)
+    return [output.with_name(f"{output.stem}-{i:02d}{output.suffix}") for i in range(sensors)]
+
+
+class PeriodGenerator:
+    """Generates rows for a list of periods in vectorized batches.
+
+    Each period lasts `time` rows, draws every value uniformly from its range
+    (rounded to two decimals) and blanks all values of a row with probability `error`.
+    """
+
+    def __init__(self, periods, rng, start_time, interval=60, repeat=False):
+        self.durations = np.array([period.get('time', 0) for period in periods], dtype=np.int64)
+        self.ends = np.cumsum(self.durations)
+        self.total = int(self.ends[-1]) if len(self.ends) else 0
+        self.lows = np.array([[period.get(key, (0, 0))[0] for key in ('temperature', 'humidity', 'light')]
+                              for period in periods], dtype=float).reshape(-1, 3)
+        self.highs = np.array([[period.get(key, (0, 0))[1] for key in ('temperature', 'humidity', 'light')]
+                               for period in periods], dtype=float).reshape(-1, 3)
+        self.errors = np.array([period.get('error', 0) for period in periods], dtype=float)
+        self.rng = rng
+        self.start = np.datetime64(start_time.replace(microsecond=0), 's')
+        self.interval = interval
+        self.repeat = repeat
+        self.position = 0
+
+    def remaining(self):
+        return None if self.repeat else self.total - self.position
+
+    def next_frame(self, count):
+        if not self.repeat:
+            count = min(count, self.total - self.position)
+        rows = self.position + np.arange(count, dtype=np.int64)
+        period = np.searchsorted(self.ends, rows % self.total, side='right')
+        values = self.lows[period] + (self.highs[period] - self.lows[period]) * self.rng.random((count, 3))
+        values = values.round(2)
+        values[self.rng.random(count) < self.errors[period]] = np.nan
+        times = self.start + rows * np.timedelta64(self.interval, 's')
+        self.position += count
+        return pd.DataFrame({
+            'Time': times,
+            'Temperature': values[:, 0],
+            'Humidity': values[:, 1],
+            'Light': values[:, 2],
+        })
+
+
+def generate_sensor_data(periods, output_file='sensor_data.csv', sensors=1, seed=None, start_time=None, interval=60):
+    start_time = start_time or datetime.now()
+    seeds = np.random.SeedSequence(seed).spawn(sensors)
+    for path, sensor_seed in zip(sensor_paths(output_file, sensors), seeds):
+        generator = PeriodGenerator(periods, np.random.default_rng(sensor_seed), start_time, interval)
+        with open(path, mode='w', newline='') as file:
+            file.write(','.join(HEADER) + '\n')
+            while generator.remaining():
+                generator.next_frame(CHUNK_ROWS).to_csv(file, header=False, index=False)
+        print(f"Data written to {path} ({generator.total} rows)")
+
+
+def write_row(file, line, rng, partial):
+    # Loggers sometimes flush part of a line before the rest
+    if partial and rng.random() < partial:
+        split = rng.randrange(1, len(line))
+        file.write(line[:split])
+        file.flush()
+        time.sleep(0.01)
+        line = line[split:]
+    file.write(line)
+    file.flush()
+
+
+def open_output(path):
+    new_file = not path.exists() or path.stat().st_size == 0
+    file = open(path, mode='a', newline='')
+    if new_file:
+        file.write(','.join(HEADER) + '\n')
+        file.flush()
+    return file
+
+
+def reopen_if_rotated(path, file):
+    # After the bot rotates a file, rows go to the new file at the same path
+    try:
+        if os.stat(path).st_ino == os.fstat(file.fileno()).st_ino:
+            return file
+    except FileNotFoundError:
+        pass
+    file.close()
+    return open_output(path)
+
+
+def run_live(periods, output_file, sensors=1, seed=None, start_time=None, interval=60, rate=1 / 60,
+             duration=None, partial=0.0):
+    # Live mode cycles through the periods, which needs at least one row in total
+    if sum(period.get('time', 0) for period in periods) <= 0:
+        print("Error: live mode needs periods with a total time of at least one row")
+        return
+    start_time = start_time or datetime.now()
+    paths = sensor_paths(output_file, sensors)
+    seeds = np.random.SeedSequence(seed).spawn(sensors)
+    generators = [PeriodGenerator(periods, np.random.default_rng(s), start_time, interval, repeat=True) for s in seeds]
+    flush_rng = random.Random(seed)
+    files = [open_output(path) for path in paths]
+    print(f"Appending {rate} rows per second to {len(files)} files, press Ctrl+C to stop")
+
+    # Rows are generated in batches and written one at a time on a fixed schedule
+    batch = max(1, int(rate))
+    pending = [[] for _ in files]
+    began = time.monotonic()
+    written = 0
+    try:
+        while duration is None or time.monotonic() - began < duration:
+            for i, generator in enumerate(generators):
+                if not pending[i]:
+                    frame = generator.next_frame(batch)
+                    pending[i] = frame.to_csv(header=False, index=False).splitlines(keepends=True)[::-1]
+                files[i] = reopen_if_rotated(paths[i], files[i])
+                write_row(files[i], pending[i].pop(), flush_rng, partial)
+            written += 1
+            delay = began + written / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for file in files:
+            file.close()
+    print(f"Appended {written} rows to each of {len(files)} files")
 
-def generate_sensor_data(periods, output_file='sensor_data.csv'):
-    current_time = datetime.now()
-    rows = []
-
-    for period in periods:
-        duration = period.get('time', 0)
-        temp_range = period.get('temperature', (0, 0))
-        humid_range = period.get('humidity', (0, 0))
-        light_range = period.get('light', (0, 0))
-        error_rate = period.get('error', 0)
-
-        for _ in range(duration):
-            is_error = random.random() < error_rate
-            if is_error:
-                row = [current_time.strftime('%Y-%m-%d %H:%M:%S'), None, None, None]
-            else:
-                temp = round(random.uniform(*temp_range), 2)
-                humid = round(random.uniform(*humid_range), 2)
-                light = round(random.uniform(*light_range), 2)
-                row = [current_time.strftime('%Y-%m-%d %H:%M:%S'), temp, humid, light]
-            rows.append(row)
-            current_time += timedelta(minutes=1)
-
-    with open(output_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Time', 'Temperature', 'Humidity', 'Light'])
-        writer.writerows(rows)
-
-    print(f"Data written to {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description='Simulate sensor data and output to a CSV file.')
     parser.add_argument('config', type=str, help='JSON string or path to JSON file with configuration')
     parser.add_argument('--output', type=str, default='sensor_data.csv', help='Output CSV file name')
+    parser.add_argument('--sensors', type=int, default=1, help='Number of sensor files to write')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+    parser.add_argument('--start', type=str, default=None, help='Timestamp of the first row (default: now)')
+    parser.add_argument('--interval', type=int, default=60, help='Seconds between rows')
+    parser.add_argument('--live', action='store_true', help='Append rows continuously instead of writing files at once')
+    parser.add_argument('--rate', type=float, default=1 / 60, help='Live mode: rows per second per file')
+    parser.add_argument('--duration', type=float, default=None, help='Live mode: seconds to run (default: until Ctrl+C)')
+    parser.add_argument('--partial', type=float, default=0.0, help='Live mode: probability of flushing part of a line')
 
     args = parser.parse_args()
 
@@ -58,8 +184,12 @@ def main():
         print(f"Error loading configuration: {e}")
         return
 
-    generate_sensor_data(periods, args.output)
+    start_time = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S') if args.start else None
+    if args.live:
+        run_live(periods, args.output, args.sensors, args.seed, start_time, args.interval, args.rate,
+                 args.duration, args.partial)
+    else:
+        generate_sensor_data(periods, args.output, args.sensors, args.seed, start_time, args.interval)
 
 if __name__ == '__main__':
     main()
-
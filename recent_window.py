@@ -0,0 +1,66 @@
+import numpy as np
+from history import COLUMNS, in_order
+
+
+class RecentWindow:
+    """Fixed-capacity ring buffer of the most recent readings as typed arrays.
+
+    version is bumped on every append so caches built from the window can tell
+    when they are stale.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, _, dtype in COLUMNS}
+        self.start = 0
+        self.size = 0
+        self.version = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def first_timestamp(self):
+        return int(self.columns['time'][self.start]) if self.size else None
+
+    @property
+    def last_timestamp(self):
+        return int(self.columns['time'][(self.start + self.size - 1) % self.capacity]) if self.size else None
+
+    def append(self, columns):
+        times = columns['time']
+        # Same ordering rule as the history store
+        keep = in_order(times, self.last_timestamp)
+        if not keep.all():
+            columns = {name: values[keep] for name, values in columns.items()}
+        count = len(columns['time'])
+        if not count:
+            return 0
+
+        if count >= self.capacity:
+            columns = {name: values[-self.capacity:] for name, values in columns.items()}
+            self.start = 0
+            self.size = 0
+        end = (self.start + self.size) % self.capacity
+        written = min(count, self.capacity)
+        positions = (end + np.arange(written)) % self.capacity
+        for name, _, _ in COLUMNS:
+            self.columns[name][positions] = columns[name][-written:]
+        overflow = max(0, self.size + written - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.capacity, self.size + written)
+        self.version += 1
+        return written
+
+    def ordered(self):
+        if self.start + self.size <= self.capacity:
+            return {name: values[self.start:self.start + self.size] for name, values in self.columns.items()}
+        return {name: np.concatenate((values[self.start:], values[:(self.start + self.size) % self.capacity]))
+                for name, values in self.columns.items()}
+
+    def query(self, start, end):
+        """Readings with start <= time <= end, in time order."""
+        columns = self.ordered()
+        low = np.searchsorted(columns['time'], start, side='left')
+        high = np.searchsorted(columns['time'], end, side='right')
+        return {name: values[low:high] for name, values in columns.items()}
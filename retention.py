@@ -0,0 +1,96 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Rotated segments are named <file>.csv.<YYYYmmdd-HHMMSS>, and <...>.gz once compressed
+SEGMENT_PATTERN = re.compile(r'^(.+\.csv)\.(\d{8}-\d{6})(\.gz)?$')
+STAMP_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def segment_path(file_path, when):
+    return f"{file_path}.{when.strftime(STAMP_FORMAT)}"
+
+
+def is_segment(file_path):
+    """Whether a path is a rotated segment that has not been compressed yet."""
+    match = SEGMENT_PATTERN.match(str(file_path))
+    return bool(match) and not match.group(3)
+
+
+def is_data_file(file_path):
+    return str(file_path).endswith('.csv') or is_segment(file_path)
+
+
+def source_path(file_path):
+    """The live CSV file a rotated segment came from, or the path itself."""
+    match = SEGMENT_PATTERN.match(str(file_path))
+    return match.group(1) if match and not match.group(3) else str(file_path)
+
+
+def find_segments(data_dir, recursive=False, compressed=False):
+    pattern = '**/*.csv.*' if recursive else '*.csv.*'
+    segments = []
+    for path in Path(data_dir).glob(pattern):
+        match = SEGMENT_PATTERN.match(str(path))
+        if match and bool(match.group(3)) == compressed and path.is_file():
+            segments.append(str(path))
+    return sorted(segments)
+
+
+def rotate_file(file_path, segment):
+    """Move a live CSV file to segment and put an empty file with the same header in its place.
+
+    The file is hard-linked to the segment name before the new file is renamed over
+    the live path, so the path never goes missing: writers that reopen it get the
+    new file, and writes through an already open handle end up in the segment.
+    Returns False when the file holds no rows yet.
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        if not header.endswith(b'\n') or not f.read(1):
+            return False
+    temporary = f"{file_path}.rotating"
+    with open(temporary, 'wb') as f:
+        f.write(header)
+    shutil.copymode(file_path, temporary)
+    try:
+        os.link(file_path, segment)
+    except OSError as e:
+        # Some filesystems have no hard links; a writer opening the file right now may then lose a row
+        logger.warning(f"Could not link {file_path} to {segment} ({e}), renaming instead")
+        os.rename(file_path, segment)
+    os.replace(temporary, file_path)
+    return True
+
+
+def compress_segment(segment):
+    """Gzip a finished segment and remove the uncompressed file."""
+    target = f"{segment}.gz"
+    temporary = f"{target}.tmp"
+    with open(segment, 'rb') as source, gzip.open(temporary, 'wb') as destination:
+        shutil.copyfileobj(source, destination, 1024 * 1024)
+    os.replace(temporary, target)
+    os.remove(segment)
+    return target
+
+
+def delete_expired(data_dir, recursive, retention):
+    """Delete compressed segments older than retention seconds, returning their paths."""
+    deadline = time.time() - retention
+    deleted = []
+    for path in find_segments(data_dir, recursive, compressed=True):
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+                deleted.append(path)
+        except FileNotFoundError:
+            continue
+    for path in deleted:
+        logger.info(f"Deleted expired segment {path}")
+    return deleted
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+
+def sensor_id(file_path, data_dir):
+    """Sensor a CSV file belongs to.
+
+    Files in a subdirectory of the data directory belong to the sensor named after
+    that subdirectory (data/chamber-3/2025-05.csv -> chamber-3); files directly in
+    the data directory are named after the file (data/chamber-3.csv -> chamber-3).
+    """
+    path = Path(file_path).resolve()
+    try:
+        relative = path.relative_to(Path(data_dir).resolve())
+    except ValueError:
+        return path.stem
+    if len(relative.parts) > 1:
+        return relative.parts[0]
+    return path.stem
+
+
+def find_csv_files(data_dir, recursive=False):
+    pattern = '**/*.csv' if recursive else '*.csv'
+    return sorted(str(path) for path in Path(data_dir).glob(pattern) if path.is_file())
+
+
+def resolve_thresholds(user_id, sensor, sensor_thresholds, thresholds, default):
+    """A user's thresholds for a sensor: per-sensor range, then own range, then default."""
+    per_sensor = sensor_thresholds.get(user_id)
+    if per_sensor and sensor in per_sensor:
+        return per_sensor[sensor]
+    return thresholds.get(user_id, default)
+
+
+def is_subscribed(user_id, sensor, subscriptions):
+    """Users without subscriptions receive alerts for every sensor."""
+    sensors = subscriptions.get(user_id)
+    return not sensors or sensor in sensors
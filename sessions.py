@@ -0,0 +1,127 @@
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """Keeps the set of authenticated users and expires their sessions on a timer.
+
+    user_states stays the persisted record of each session. Deadlines are kept in a
+    min-heap and a single JobQueue job is scheduled for the earliest one, so finding
+    alert recipients never has to look at expiry times. Heap entries left behind by
+    a renewed or ended session are skipped when they come up.
+    """
+
+    def __init__(self, user_states, duration, warning=0):
+        self.user_states = user_states
+        self.duration = duration
+        self.warning = warning
+        self.active = set()
+        self.deadlines = []
+        self.warnings = []
+        self.job_queue = None
+        self.job = None
+        self.next_run = None
+        self.notify = None
+
+    def __contains__(self, user_id):
+        return user_id in self.active
+
+    def __len__(self):
+        return len(self.active)
+
+    def load(self):
+        """Rebuild the active set and deadlines from the stored user states."""
+        now = datetime.now()
+        self.active.clear()
+        self.deadlines.clear()
+        self.warnings.clear()
+        for user_id, state in list(self.user_states.items()):
+            if not state.get('authenticated'):
+                continue
+            expires = state.get('expires')
+            if expires is not None and expires <= now:
+                self._expire(user_id)
+            else:
+                self._add(user_id, expires, now)
+        logger.info(f"Loaded {len(self.active)} active sessions")
+        self._schedule()
+
+    def start(self, job_queue, notify=None):
+        self.job_queue = job_queue
+        self.notify = notify
+        if job_queue is None:
+            logger.warning("JobQueue is not available, sessions will not expire")
+        self._schedule()
+
+    def stop(self):
+        if self.job is not None:
+            self.job.schedule_removal()
+            self.job = None
+
+    def login(self, user_id):
+        expires = datetime.now() + timedelta(minutes=self.duration)
+        state = self.user_states.setdefault(user_id, {})
+        state['authenticated'] = True
+        state['expires'] = expires
+        self.user_states.touch(user_id)
+        self._add(user_id, expires, datetime.now())
+        self._schedule()
+        return expires
+
+    def logout(self, user_id):
+        state = self.user_states.setdefault(user_id, {})
+        state['authenticated'] = False
+        self.user_states.touch(user_id)
+        self.active.discard(user_id)
+
+    def _add(self, user_id, expires, now):
+        self.active.add(user_id)
+        if expires is None:
+            return
+        heapq.heappush(self.deadlines, (expires, user_id))
+        if self.warning and expires - timedelta(minutes=self.warning) > now:
+            heapq.heappush(self.warnings, (expires - timedelta(minutes=self.warning), user_id, expires))
+
+    def _current(self, user_id, expires):
+        return user_id in self.active and self.user_states.get(user_id, {}).get('expires') == expires
+
+    def _expire(self, user_id):
+        logger.info(f"User {user_id}'s session has expired")
+        self.logout(user_id)
+
+    def _schedule(self):
+        if self.job_queue is None:
+            return
+        heads = [heap[0][0] for heap in (self.deadlines, self.warnings) if heap]
+        if not heads:
+            return
+        when = min(heads)
+        if self.job is not None and self.next_run is not None and self.next_run <= when:
+            return
+        if self.job is not None:
+            self.job.schedule_removal()
+        delay = max(0.0, (when - datetime.now()).total_seconds())
+        self.job = self.job_queue.run_once(self._run, delay, name='session-expiry')
+        self.next_run = when
+
+    async def _run(self, context):
+        self.job = None
+        self.next_run = None
+        now = datetime.now()
+        while self.warnings and self.warnings[0][0] <= now:
+            _, user_id, expires = heapq.heappop(self.warnings)
+            if self._current(user_id, expires) and self.notify is not None:
+                minutes = max(1, round((expires - now).total_seconds() / 60))
+                self.notify(
+                    user_id,
+                    f"⏰ Your session expires in {minutes} minute{'s' if minutes != 1 else ''} and alerts will stop. "
+                    "Use /login to sign in again, or /start if you are whitelisted."
+                )
+        while self.deadlines and self.deadlines[0][0] <= now:
+            expires, user_id = heapq.heappop(self.deadlines)
+            if self._current(user_id, expires):
+                self._expire(user_id)
+        self._schedule()
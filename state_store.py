@@ -0,0 +1,195 @@
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def encode_value(value):
+    def default(o):
+        if isinstance(o, datetime):
+            return {'__datetime__': o.isoformat()}
+        raise TypeError(f"Cannot store value of type {type(o).__name__}")
+    return json.dumps(value, default=default)
+
+
+def decode_value(text):
+    def object_hook(o):
+        if '__datetime__' in o:
+            return datetime.fromisoformat(o['__datetime__'])
+        return o
+    return json.loads(text, object_hook=object_hook)
+
+
+class StateBackend:
+    """Storage used by StateStore; keys and values arrive already JSON-encoded."""
+
+    def load_all(self):
+        return []
+
+    def write_batch(self, upserts, deletes):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStateBackend(StateBackend):
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        # Writes happen on an executor thread, reads only at startup
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+        self.connection.commit()
+
+    def load_all(self):
+        return self.connection.execute('SELECT namespace, key, value FROM state').fetchall()
+
+    def write_batch(self, upserts, deletes):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value',
+                upserts
+            )
+            self.connection.executemany('DELETE FROM state WHERE namespace = ? AND key = ?', deletes)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class StateTable(dict):
+    """A dict that records which keys changed so the store can write them behind.
+
+    Assignments and deletions are tracked automatically; call touch(key) after
+    mutating a nested value in place.
+    """
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.dirty = set()
+
+    def touch(self, key):
+        self.dirty.add(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.dirty.add(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self.dirty.update(self)
+        super().clear()
+
+
+class StateStore:
+    """In-memory state tables persisted in the background.
+
+    Reads and writes only touch the in-memory tables; a background task
+    periodically encodes the changed keys and writes them to the backend in one
+    transaction on an executor thread.
+    """
+
+    def __init__(self, backend=None, flush_interval=2.0):
+        self.backend = backend or StateBackend()
+        self.flush_interval = flush_interval
+        self.tables = {}
+        self.task = None
+        self.flushes = 0
+        self.flush_lock = asyncio.Lock()
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = StateTable(name)
+        return self.tables[name]
+
+    def open(self, backend):
+        """Switch to a backend and load all of its state in one bulk read."""
+        self.backend = backend
+        start = time.perf_counter()
+        rows = backend.load_all()
+        for table in self.tables.values():
+            dict.clear(table)
+            table.dirty.clear()
+        for namespace, key, value in rows:
+            dict.__setitem__(self.table(namespace), json.loads(key), decode_value(value))
+        logger.info(f"Loaded {len(rows)} state entries in {time.perf_counter() - start:.3f}s")
+
+    def collect(self):
+        upserts = []
+        deletes = []
+        touched = []
+        for name, table in self.tables.items():
+            dirty, table.dirty = table.dirty, set()
+            touched.append((table, dirty))
+            for key in dirty:
+                if key in table:
+                    upserts.append((name, json.dumps(key), encode_value(table[key])))
+                else:
+                    deletes.append((name, json.dumps(key)))
+        return upserts, deletes, touched
+
+    async def flush(self):
+        # One flush at a time, so an older batch never lands after a newer one
+        async with self.flush_lock:
+            upserts, deletes, touched = self.collect()
+            if not upserts and not deletes:
+                return
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.backend.write_batch, upserts, deletes)
+            except Exception:
+                # Keep the keys dirty so the next flush retries them
+                for table, dirty in touched:
+                    table.dirty.update(dirty)
+                raise
+        self.flushes += 1
+        logger.debug(f"Flushed {len(upserts)} updates and {len(deletes)} deletions to the state store")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing state store: {e}", exc_info=True)
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        self.backend.close()
@@ -0,0 +1,131 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (threshold key, CSV column, alert label) for every monitored metric
+METRICS = [
+    ('temperature', 'Temperature', 'Temperature'),
+    ('humidity', 'Humidity', 'Humidity'),
+    ('light', 'Light', 'Light intensity'),
+]
+
+
+def threshold_key(thresholds):
+    return tuple((thresholds[key]['min'], thresholds[key]['max']) for key, _, _ in METRICS)
+
+
+def batch_range(df):
+    """Smallest and largest reading of every metric in a batch, NaN where all are missing."""
+    values = df[[column for _, column, _ in METRICS]].to_numpy(dtype=float)
+    return np.fmin.reduce(values, axis=0), np.fmax.reduce(values, axis=0)
+
+
+class ThresholdEngine:
+    """Finds the users with at least one reading of a batch outside their ranges.
+
+    A batch violates a range exactly when its smallest or largest reading does, so
+    only the per-metric extremes of the batch are compared. Users with identical
+    threshold sets are grouped and every distinct set is compared in a single NumPy
+    broadcast. Once enough users have custom ranges, those users are looked up
+    through a ThresholdIndex instead, with one binary search per bound and metric.
+    """
+
+    def __init__(self, index=None, index_min_users=0):
+        self.index = index
+        self.index_min_users = index_min_users
+
+    def evaluate(self, df, thresholds_by_user):
+        """Return the set of users with a reading outside their thresholds."""
+        if df.empty or self.index is None or len(self.index) < self.index_min_users:
+            return self.evaluate_broadcast(df, thresholds_by_user)
+
+        # Users whose thresholds here differ from their indexed range (per-sensor overrides) are broadcast
+        indexed = {user_id for user_id, thresholds in thresholds_by_user.items()
+                   if self.index.thresholds.get(user_id) is thresholds}
+        rest = {user_id: thresholds for user_id, thresholds in thresholds_by_user.items() if user_id not in indexed}
+        results = self.evaluate_broadcast(df, rest)
+        return results | self.index.evaluate(df, indexed)
+
+    def evaluate_broadcast(self, df, thresholds_by_user):
+        groups = {}
+        for user_id, thresholds in thresholds_by_user.items():
+            groups.setdefault(threshold_key(thresholds), []).append(user_id)
+        if not groups or df.empty:
+            return set()
+
+        keys = list(groups)
+        bounds = np.array(keys, dtype=float)
+        lows, highs = batch_range(df)
+        logger.debug(f"Evaluating {len(df)} rows against {len(keys)} distinct threshold sets")
+        # Comparisons with NaN are false, so metrics without readings never violate
+        violated = ((lows < bounds[:, :, 0]) | (highs > bounds[:, :, 1])).any(axis=1)
+        return {user_id for set_index in np.flatnonzero(violated) for user_id in groups[keys[set_index]]}
+
+
+class ThresholdIndex:
+    """Sorted per-metric arrays of user minimums and maximums.
+
+    A reading is below the range of every user whose minimum is greater than it
+    (a suffix of the sorted minimums) and above the range of every user whose
+    maximum is smaller than it (a prefix of the sorted maximums), so violators
+    are found with two binary searches plus the size of the output.
+    """
+
+    def __init__(self, thresholds_by_user=None):
+        self.rebuild(thresholds_by_user or {})
+
+    def rebuild(self, thresholds_by_user):
+        self.thresholds = dict(thresholds_by_user)
+        users = np.fromiter(self.thresholds, dtype=np.int64, count=len(self.thresholds))
+        self.bounds = {}
+        for key, _, _ in METRICS:
+            self.bounds[key] = {}
+            for bound in ('min', 'max'):
+                values = np.array([float(t[key][bound]) for t in self.thresholds.values()])
+                order = np.argsort(values, kind='stable')
+                self.bounds[key][bound] = (values[order], users[order])
+
+    def __len__(self):
+        return len(self.thresholds)
+
+    def __contains__(self, user_id):
+        return user_id in self.thresholds
+
+    def update(self, user_id, thresholds):
+        if user_id in self.thresholds:
+            self.remove(user_id)
+        self.thresholds[user_id] = thresholds
+        for key, _, _ in METRICS:
+            for bound in ('min', 'max'):
+                values, users = self.bounds[key][bound]
+                value = float(thresholds[key][bound])
+                position = np.searchsorted(values, value)
+                self.bounds[key][bound] = (np.insert(values, position, value), np.insert(users, position, user_id))
+
+    def remove(self, user_id):
+        thresholds = self.thresholds.pop(user_id, None)
+        if thresholds is None:
+            return
+        for key, _, _ in METRICS:
+            for bound in ('min', 'max'):
+                values, users = self.bounds[key][bound]
+                value = float(thresholds[key][bound])
+                start = np.searchsorted(values, value, side='left')
+                end = np.searchsorted(values, value, side='right')
+                position = start + np.flatnonzero(users[start:end] == user_id)[0]
+                self.bounds[key][bound] = (np.delete(values, position), np.delete(users, position))
+
+    def evaluate(self, df, user_ids=None):
+        """Return the set of indexed users (limited to user_ids if given) with a reading outside their range."""
+        lows, highs = batch_range(df)
+        found = []
+        for index, (key, _, _) in enumerate(METRICS):
+            if lows[index] != lows[index]:
+                continue
+            mins, min_users = self.bounds[key]['min']
+            maxs, max_users = self.bounds[key]['max']
+            found.append(min_users[np.searchsorted(mins, lows[index], side='right'):])
+            found.append(max_users[:np.searchsorted(maxs, highs[index], side='left')])
+        violators = set(np.concatenate(found).tolist()) if found else set()
+        return violators if user_ids is None else violators & set(user_ids)